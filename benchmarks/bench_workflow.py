@@ -0,0 +1,206 @@
+"""
+CPU micro-benchmarks for the workflow hot path on synthetic ComfyUI graphs.
+
+Times and memory-profiles load_workflow, the find_* helpers, modify_workflow, the graph
+part of modify_i2i_workflow (bind_i2i_inputs; the upload is network-bound and excluded),
+extract_output_info and the hashing done per submission, across graph sizes.
+
+Usage:
+    python benchmarks/bench_workflow.py --sizes 10,100,1000,5000 --output bench_output.json
+
+Results are written as JSON so runs can be diffed or checked in CI.
+"""
+import sys
+import json
+import copy
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from hh_mcp_comfyui import comfyui_client, prompt_scheduler, journal  # noqa: E402
+
+FILLER_TYPES = ["ImageScale", "ImageBlur", "LatentUpscale", "ConditioningCombine", "ImageSharpen"]
+
+# --- Synthetic Graphs ---
+
+def generate_workflow(nodes: int, fan_out: int = 2, samplers: int = 1, saves: int = 1, seed: int = 0) -> Dict[str, Any]:
+    """
+    Builds an API-format ComfyUI graph with roughly `nodes` nodes.
+
+    Filler nodes come first and each links to up to `fan_out` earlier nodes, so the find_*
+    helpers have to scan past them (the worst case for first-match lookups). The core
+    pipeline (loader, encoders, latent, samplers, decoders, save nodes) follows.
+    """
+    rng = random.Random(seed)
+    workflow: Dict[str, Any] = {}
+    core_nodes = 3 + max(samplers, 1) * 4 + saves
+    filler_count = max(nodes - core_nodes, 0)
+
+    next_id = 1
+    for _ in range(filler_count):
+        node_id = str(next_id)
+        inputs: Dict[str, Any] = {"strength": rng.random(), "label": f"filler {node_id}"}
+        for link in range(min(fan_out, next_id - 1)):
+            inputs[f"input_{link}"] = [str(rng.randint(1, next_id - 1)), 0]
+        workflow[node_id] = {
+            "inputs": inputs,
+            "class_type": rng.choice(FILLER_TYPES),
+            "_meta": {"title": f"Filler {node_id}"},
+        }
+        next_id += 1
+
+    def add(class_type: str, inputs: Dict[str, Any]) -> str:
+        nonlocal next_id
+        node_id = str(next_id)
+        workflow[node_id] = {"inputs": inputs, "class_type": class_type, "_meta": {"title": class_type}}
+        next_id += 1
+        return node_id
+
+    loader = add("CheckpointLoaderSimple", {"ckpt_name": "model.safetensors"})
+    negative = add("CLIPTextEncode", {"text": "text, watermark", "clip": [loader, 1]})
+    latent = add("EmptyLatentImage", {"width": 512, "height": 512, "batch_size": 1})
+    decoders = []
+    for index in range(max(samplers, 1)):
+        positive = add("CLIPTextEncode", {"text": f"prompt {index}", "clip": [loader, 1]})
+        sampler = add("KSampler", {
+            "seed": index, "steps": 20, "cfg": 8, "sampler_name": "euler", "scheduler": "normal",
+            "denoise": 1, "model": [loader, 0], "positive": [positive, 0], "negative": [negative, 0],
+            "latent_image": [latent, 0],
+        })
+        decoders.append(add("VAEDecode", {"samples": [sampler, 0], "vae": [loader, 2]}))
+        add("LoadImage", {"image": f"input_{index}.png"})
+    for index in range(saves):
+        add("SaveImage", {"filename_prefix": "ComfyUI", "images": [decoders[index % len(decoders)], 0]})
+    return workflow
+
+def generate_history(outputs: int, images_per_output: int = 4) -> Dict[str, Any]:
+    """Builds a /history entry whose output images are all 'temp' except in the last node."""
+    history_outputs = {}
+    for index in range(outputs):
+        file_type = "output" if index == outputs - 1 else "temp"
+        history_outputs[str(index)] = {
+            "images": [
+                {"filename": f"ComfyUI_{index:05d}_{n}.png", "subfolder": "2025-01-01", "type": file_type}
+                for n in range(images_per_output)
+            ]
+        }
+    return {"outputs": history_outputs, "status": {"status_str": "success", "completed": True}}
+
+# --- Measurement ---
+
+def measure(func: Callable[[Any], Any], make_input: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Times func on fresh inputs (built outside the timed region), then records its peak allocation."""
+    timings = []
+    for _ in range(repeat):
+        arg = make_input()
+        started = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - started)
+
+    arg = make_input()
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "repeat": repeat,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+        "peak_bytes": peak,
+    }
+
+def run_benchmarks(sizes: list[int], fan_out: int, samplers: int, saves: int,
+                   history_outputs: int, repeat: int) -> list[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as workflows_dir:
+        comfyui_client.WORKFLOWS_DIR = Path(workflows_dir)
+        history = generate_history(history_outputs)
+
+        for nodes in sizes:
+            workflow = generate_workflow(nodes, fan_out, samplers, saves)
+            workflow_name = f"synthetic_{nodes}.json"
+            with open(Path(workflows_dir) / workflow_name, "w", encoding="utf-8") as f:
+                json.dump(workflow, f)
+
+            fresh = lambda: copy.deepcopy(workflow)  # modify_* mutate nested node dicts
+            same = lambda: workflow
+            cases: Dict[str, tuple[Callable[[Any], Any], Callable[[], Any]]] = {
+                "load_workflow": (lambda _: comfyui_client.load_workflow(workflow_name), same),
+                "find_load_image_node": (comfyui_client.find_load_image_node, same),
+                "find_scheduler_node": (comfyui_client.find_scheduler_node, same),
+                "find_latent_by_class_type": (comfyui_client.find_latent_by_class_type, same),
+                "find_save_image_node": (comfyui_client.find_save_image_node, same),
+                "find_random_seed_node": (comfyui_client.find_random_seed_node, same),
+                "find_positive_prompt_node": (comfyui_client.find_positive_prompt_node, same),
+                "modify_workflow": (
+                    lambda wf: comfyui_client.modify_workflow(wf, "benchmark prompt", 1024, 1024, 42, {"steps": 4}),
+                    fresh,
+                ),
+                "modify_i2i_workflow.bind_i2i_inputs": (
+                    lambda wf: comfyui_client.bind_i2i_inputs(wf, "benchmark prompt", "input.png", 0.8, 42),
+                    fresh,
+                ),
+                "workflow_affinity_key": (prompt_scheduler.workflow_affinity_key, same),
+                "canonical_request_hash": (journal.canonical_request_hash, same),
+            }
+            for name, (func, make_input) in cases.items():
+                result = measure(func, make_input, repeat)
+                result.update({"function": name, "nodes": len(workflow), "fan_out": fan_out,
+                               "samplers": samplers, "saves": saves})
+                results.append(result)
+                print(f"{name:40s} nodes={len(workflow):6d} median={result['median_s'] * 1e6:10.1f}us "
+                      f"peak={result['peak_bytes']:10d}B", file=sys.stderr)
+
+        result = measure(comfyui_client.extract_output_info, lambda: history, repeat)
+        result.update({"function": "extract_output_info", "history_outputs": history_outputs})
+        results.append(result)
+        print(f"{'extract_output_info':40s} outputs={history_outputs:6d} median={result['median_s'] * 1e6:10.1f}us",
+              file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="Comma-separated node counts")
+    parser.add_argument("--fan-out", type=int, default=2, help="Links per filler node")
+    parser.add_argument("--samplers", type=int, default=1, help="Sampler chains per graph")
+    parser.add_argument("--saves", type=int, default=1, help="Save nodes per graph")
+    parser.add_argument("--history-outputs", type=int, default=1000, help="Output nodes in the synthetic history")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per case")
+    parser.add_argument("--with-logging", action="store_true", help="Keep the client's INFO logging enabled")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logging.disable(logging.WARNING)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "logging": args.with_logging,
+        },
+        "results": run_benchmarks(sizes, args.fan_out, args.samplers, args.saves, args.history_outputs, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+if __name__ == "__main__":
+    main()
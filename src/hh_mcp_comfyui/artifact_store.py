@@ -0,0 +1,207 @@
+import os
+import struct
+import sqlite3
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+import httpx
+
+try:
+    from .resilience import HTTP_TIMEOUT
+    from .shared_cache import SharedCache
+except ImportError:
+    from hh_mcp_comfyui.resilience import HTTP_TIMEOUT
+    from hh_mcp_comfyui.shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = Path(os.getenv("COMFYUI_ARTIFACT_DIR", Path.home() / ".cache" / "hh-mcp-comfyui" / "artifacts"))
+ARTIFACT_MAX_BYTES = int(os.getenv("COMFYUI_ARTIFACT_MAX_BYTES", str(2 * 1024 ** 3)))  # 0 disables the store
+CHUNK_SIZE = 1024 * 1024
+
+# Shared cache namespaces
+OBJECT_NAMESPACE = "artifact"
+REF_NAMESPACE = "artifact_ref"
+UPLOAD_NAMESPACE = "upload"
+
+def is_digest(value: str) -> bool:
+    """True if value looks like a sha256 hex digest."""
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def guess_mime_type(data: bytes) -> str:
+    """Returns the image MIME type of data from its magic bytes."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return "application/octet-stream"
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Returns (width, height) read from a PNG, JPEG, WebP or GIF header, or None."""
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", data[16:24])
+        if data.startswith((b"GIF87a", b"GIF89a")):
+            return struct.unpack("<HH", data[6:10])
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        if data.startswith(b"\xff\xd8"):
+            offset = 2
+            while offset + 9 < len(data):
+                if data[offset] != 0xFF:
+                    return None
+                marker = data[offset + 1]
+                length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):  # Start of frame
+                    height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+                    return width, height
+                offset += 2 + length
+    except struct.error:
+        pass
+    return None
+
+# --- Content-Addressed Artifact Store ---
+
+class ArtifactStore:
+    """
+    Local content-addressed store for images produced by ComfyUI.
+
+    Objects are stored under objects/<aa>/<bb>/<sha256> so no directory grows too large.
+    Refs map an external key (usually the ComfyUI /view URL) to the digest of its content,
+    so an output is pulled from the backend only once. Objects and refs are indexed in a
+    SharedCache, so every server process on the host shares them and the size bound; the
+    least recently used objects are evicted first.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / "tmp"
+        for directory in (self.objects_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        self.cache = SharedCache(self.root / "index.sqlite3", max_bytes)
+        self.cache.on_evict(OBJECT_NAMESPACE, self._remove_object)
+        if self.cache.count(OBJECT_NAMESPACE) == 0:
+            self._index_existing_objects()
+
+    def object_path(self, digest: str) -> Path:
+        """Returns the sharded path of an object."""
+        return self.objects_dir / digest[:2] / digest[2:4] / digest
+
+    def contains(self, digest: str) -> bool:
+        return self.object_path(digest).is_file()
+
+    def resolve_ref(self, ref_key: str) -> Optional[str]:
+        """Returns the digest stored for ref_key, or None if unknown or evicted."""
+        digest = self.cache.get(REF_NAMESPACE, ref_key)
+        if digest is None:
+            return None
+        if not self.contains(digest):
+            logger.debug(f"Artifact ref {ref_key} points to evicted object {digest}")
+            return None
+        return digest
+
+    def add_ref(self, ref_key: str, digest: str) -> None:
+        self.cache.put(REF_NAMESPACE, ref_key, digest)
+
+    async def fetch(self, url: str, ref_key: Optional[str] = None, refresh: bool = False) -> str:
+        """
+        Returns the digest of the content behind url, downloading it only if the store
+        does not already hold it. The body is streamed to disk and hashed on the fly.
+        refresh=True ignores an existing ref, e.g. for a freshly generated output whose
+        filename may have been reused after the backend's output directory was wiped.
+        """
+        ref_key = ref_key or url
+        digest = None if refresh else self.resolve_ref(ref_key)
+        if digest:
+            self._touch(digest)
+            logger.info(f"Artifact cache hit for {ref_key}: {digest}")
+            return digest
+
+        hasher = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
+                    async with client.stream("GET", url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            hasher.update(chunk)
+                            f.write(chunk)
+        except Exception:
+            os.unlink(tmp_name)
+            raise
+
+        digest = hasher.hexdigest()
+        if self.contains(digest):
+            os.unlink(tmp_name)
+            self._touch(digest)
+        else:
+            self._commit(Path(tmp_name), digest)
+        self.add_ref(ref_key, digest)
+        logger.info(f"Stored artifact {digest} from {url}")
+        return digest
+
+    def read_bytes(self, digest: str) -> bytes:
+        data = self.object_path(digest).read_bytes()
+        self._touch(digest)
+        return data
+
+    def _touch(self, digest: str) -> None:
+        try:
+            self.cache.touch(OBJECT_NAMESPACE, digest)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update last access of artifact {digest}: {e}")  # Only affects eviction order
+
+    def _commit(self, tmp_path: Path, digest: str) -> None:
+        path = self.object_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        self.cache.put(OBJECT_NAMESPACE, digest, digest, size)  # Evicts older objects if over the bound
+
+    def _remove_object(self, digest: str, value: str) -> None:
+        try:
+            self.object_path(digest).unlink()
+            logger.info(f"Evicted artifact {digest}")
+        except FileNotFoundError:
+            pass
+
+    def _index_existing_objects(self) -> None:
+        """Indexes objects written before the shared index existed."""
+        for p in self.objects_dir.glob("*/*/*"):
+            if p.is_file():
+                self.cache.put(OBJECT_NAMESPACE, p.name, p.name, p.stat().st_size)
+
+
+_store: Optional[ArtifactStore] = None
+
+def get_store() -> Optional[ArtifactStore]:
+    """Returns the process-wide artifact store, or None if it is disabled."""
+    global _store
+    if ARTIFACT_MAX_BYTES <= 0:
+        return None
+    if _store is None:
+        try:
+            _store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_MAX_BYTES)
+            logger.info(f"Artifact store at {ARTIFACT_DIR} (max {ARTIFACT_MAX_BYTES} bytes)")
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not initialise artifact store at {ARTIFACT_DIR}: {e}")
+            return None
+    return _store
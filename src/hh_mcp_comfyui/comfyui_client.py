@@ -1,21 +1,31 @@
 import asyncio
 import json
 import uuid
+import hashlib
 import os
 import random
+import sqlite3
 import httpx
 import time
 # import websockets
 import websocket
-from urllib.parse import urlencode, urlparse # Add urlparse
+from urllib.parse import urlencode, urlparse, parse_qs # Add urlparse
 from pathlib import Path
 import logging
-from typing import Dict, Any, Optional, Tuple, Union # Add Union
+from typing import Dict, Any, Optional, Tuple, Union, Iterator # Add Union
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import aiohttp # Add aiohttp
 import aiofiles # Add aiofiles
 from pydantic import HttpUrl
 
+try:
+    from . import artifact_store, prompt_scheduler, resilience, journal, eta
+except ImportError:
+    # Allow running this module directly for testing
+    from hh_mcp_comfyui import artifact_store, prompt_scheduler, resilience, journal, eta
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -23,6 +33,20 @@ COMFYUI_API_BASE = os.getenv("COMFYUI_API_BASE", "http://127.0.0.1:8188")
 WS_URL = f"ws://{COMFYUI_API_BASE.split('//')[1]}/ws"
 WORKFLOWS_DIR = Path(os.getenv("COMFYUI_WORKFLOWS_DIR", Path(__file__).parent / "workflows"))
 DEFAULT_WORKFLOW = "t2image_bizyair_flux.json" # Default workflow if none specified
+DRAFT_STEPS = int(os.getenv("COMFYUI_DRAFT_STEPS", "8")) # Sampling steps used for draft previews
+DRAFT_SCALE = float(os.getenv("COMFYUI_DRAFT_SCALE", "1.0")) # Resolution factor for drafts; below 1.0 a refine no longer matches the draft
+WS_PING_INTERVAL = 20 # Seconds between websocket pings while waiting for a prompt
+WS_PING_TIMEOUT = 10
+HISTORY_POLL_SECONDS = 1.0 # Polling interval when reattaching to a prompt submitted earlier
+UPLOAD_CONCURRENCY = int(os.getenv("COMFYUI_UPLOAD_CONCURRENCY", "4")) # Parallel uploads for multi-image workflows
+WS_WAIT_THREADS = int(os.getenv("COMFYUI_WS_WAIT_THREADS", "32")) # Renders that can be awaited at once
+
+# Websocket waits block a thread for the whole render; keep them off the default executor used by aiofiles
+_ws_wait_executor = ThreadPoolExecutor(max_workers=WS_WAIT_THREADS, thread_name_prefix="comfyui-ws-wait")
+
+# Client traffic, used by background work (warm-up) to stay out of the way
+active_prompts = 0
+last_activity_at = 0.0
 
 # --- Workflow Loading and Modification ---
 
@@ -61,15 +85,16 @@ def find_node_by_class_type(workflow: Dict[str, Any], class_types: list[str]) ->
             return node_id
     return None
 
+LOAD_IMAGE_TYPES = [
+    "LoadImage", # Standard
+    "LoadImageMask", # Masks for inpainting
+    "ImageLoad", # Alternative naming
+    "LoadImageBase64", # If using base64 input
+    "LoadImageOutput"   # Alternative naming
+]
+
 def find_load_image_node(workflow: Dict[str, Any]) -> Optional[str]:
     """Finds the node ID for loading the input image."""
-    LOAD_IMAGE_TYPES = [
-        "LoadImage", # Standard
-        "LoadImageMask", # If mask is also needed, but we focus on basic LoadImage
-        "ImageLoad", # Alternative naming
-        "LoadImageBase64", # If using base64 input
-        "LoadImageOutput"   # Alternative naming
-    ]
     node_id = find_node_by_class_type(workflow, LOAD_IMAGE_TYPES)
     if node_id:
         logger.debug(f"Found load image node: {node_id}")
@@ -77,6 +102,22 @@ def find_load_image_node(workflow: Dict[str, Any]) -> Optional[str]:
         logger.warning("Could not find a suitable load image node in workflow")
     return node_id
 
+def find_load_image_nodes(workflow: Dict[str, Any]) -> list[str]:
+    """Finds the IDs of all load image nodes, in workflow order."""
+    return [node_id for node_id, node_data in workflow.items() if node_data.get("class_type") in LOAD_IMAGE_TYPES]
+
+def resolve_load_image_node(workflow: Dict[str, Any], node_ref: str) -> str:
+    """Resolves a load image node given by ID or by its title ('_meta.title')."""
+    load_image_nodes = find_load_image_nodes(workflow)
+    if node_ref in load_image_nodes:
+        return node_ref
+    matches = [node_id for node_id in load_image_nodes if workflow[node_id].get("_meta", {}).get("title") == node_ref]
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        raise ValueError(f"Title '{node_ref}' matches several load image nodes ({', '.join(matches)}), use a node ID.")
+    raise ValueError(f"'{node_ref}' is not a load image node ID or title. Load image nodes: {', '.join(load_image_nodes) or 'none'}")
+
 def find_scheduler_node(workflow: Dict[str, Any]) -> Optional[str]:
     """Finds the node ID for the scheduler node controlling denoise."""
     # Common scheduler/sampler nodes that might have 'denoise'
@@ -105,26 +146,31 @@ def find_scheduler_node(workflow: Dict[str, Any]) -> Optional[str]:
     return None
 
 
+# Nodes whose width/height inputs set the output resolution
+LATENT_IMAGE_TYPES = [
+    "EmptyLatentImage",  # Standard
+    "EmptySD3LatentImage", # SD3 variant
+    "BizyAir_CogView4_6B_Pipe",  # Custom variant
+    "EmptyLatentImageAdvanced",  # Advanced variant
+    "BizyAir_ModelSamplingFlux" # ModelSamplingFlux variant
+]
+
+# Nodes that rescale an input image to about 1 megapixel, whatever its size
+MEGAPIXEL_SCALE_TYPES = ["FluxKontextImageScale", "ImageScaleToTotalPixels"]
+
+# Supported save image node class types
+SAVE_IMAGE_TYPES = [
+    "SaveImage",  # Standard
+    "SaveImageWithMetadata",  # With metadata
+    "BizyAir_SaveImage"  # Custom
+]
+
 def find_latent_by_class_type(workflow: Dict[str, Any]) -> Optional[str]:
     """Finds the first node ID matching any of the given class_types."""
-    LATENT_IMAGE_TYPES = [
-        "EmptyLatentImage",  # Standard
-        "EmptySD3LatentImage", # SD3 variant
-        "BizyAir_CogView4_6B_Pipe",  # Custom variant
-        "EmptyLatentImageAdvanced",  # Advanced variant
-        "BizyAir_ModelSamplingFlux" # ModelSamplingFlux variant
-    ]
     return find_node_by_class_type(workflow, LATENT_IMAGE_TYPES)
 
 def find_save_image_node(workflow: Dict[str, Any]) -> Optional[str]:
     """Finds the node ID for saving image by class type."""
-    # Supported save image node class types
-    SAVE_IMAGE_TYPES = [
-        "SaveImage",  # Standard
-        "SaveImageWithMetadata",  # With metadata
-        "BizyAir_SaveImage"  # Custom
-    ]
-    
     # Find first node with supported save image type
     for node_id, node_data in workflow.items():
         node_class = node_data.get("class_type", "")
@@ -178,9 +224,80 @@ def find_positive_prompt_node(workflow: Dict[str, Any]) -> Optional[str]:
     logger.warning("Could not find a suitable positive prompt node in workflow")
     return None
 
+# Declarative parameter overrides: override name -> [(node class types, input field), ...]
+# Every node matching a role gets the value, so split sampler graphs (KSamplerSelect +
+# BasicScheduler) are covered as well as all-in-one KSampler nodes.
+SAMPLER_TYPES = ["KSampler", "KSamplerAdvanced", "BizyAir_KSampler"]
+OVERRIDE_ROLES = {
+    "steps": [
+        (SAMPLER_TYPES + ["BasicScheduler", "BizyAir_BasicScheduler"], "steps"),
+        (["BizyAir_CogView4_6B_Pipe"], "num_inference_steps"),
+    ],
+    "cfg": [
+        (SAMPLER_TYPES + ["CFGGuider", "BizyAir_CFGGuider"], "cfg"),
+        (["BizyAir_CogView4_6B_Pipe"], "guidance_scale"),
+    ],
+    "guidance": [
+        (["FluxGuidance", "BizyAir_FluxGuidance"], "guidance"), # Flux distilled guidance, independent of cfg
+    ],
+    "sampler_name": [
+        (SAMPLER_TYPES + ["KSamplerSelect", "BizyAir_KSamplerSelect"], "sampler_name"),
+    ],
+    "scheduler": [
+        (SAMPLER_TYPES + ["BasicScheduler", "BizyAir_BasicScheduler"], "scheduler"),
+    ],
+    "batch_size": [
+        (["EmptyLatentImage", "EmptySD3LatentImage", "EmptyLatentImageAdvanced"], "batch_size"),
+        (["BizyAir_CogView4_6B_Pipe"], "num_images_per_prompt"),
+    ],
+}
+
+def apply_overrides(workflow: Dict[str, Any], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Applies declarative parameter overrides (steps, cfg, guidance, sampler_name, scheduler, batch_size)."""
+    for name, value in (overrides or {}).items():
+        if value is None:
+            continue
+        if name not in OVERRIDE_ROLES:
+            raise ValueError(f"Unsupported override '{name}'. Supported: {', '.join(OVERRIDE_ROLES)}")
+        applied = False
+        for class_types, field in OVERRIDE_ROLES[name]:
+            for node_id, node_data in workflow.items():
+                if node_data.get("class_type") in class_types and field in node_data.get("inputs", {}):
+                    node_data["inputs"][field] = value
+                    applied = True
+                    logger.info(f"Set {field}={value} in node {node_id}")
+        if not applied:
+            logger.warning(f"No node in workflow accepts override '{name}'")
+    return workflow
+
+def draft_parameters(width: int, height: int, overrides: Optional[Dict[str, Any]] = None) -> Tuple[int, int, Dict[str, Any]]:
+    """
+    Returns the reduced width, height and overrides for a cheap draft preview.
+    Dimensions are scaled by DRAFT_SCALE (multiples of 64) and steps capped at DRAFT_STEPS.
+    ComfyUI derives the initial noise from seed and latent shape, so only a draft at full
+    resolution (the default) is reproduced by refining with the same seed.
+    """
+    draft_width = max(64, int(width * DRAFT_SCALE) // 64 * 64)
+    draft_height = max(64, int(height * DRAFT_SCALE) // 64 * 64)
+    return draft_width, draft_height, draft_overrides(overrides)
 
-def modify_workflow(workflow: Dict[str, Any], prompt: str, width: int, height: int, seed: Optional[int] = None) -> Dict[str, Any]:
-    """Modifies the workflow with the given prompt, width, and height."""
+def draft_overrides(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Returns overrides with steps capped at DRAFT_STEPS, for drafts whose resolution is fixed (e.g. by an input image)."""
+    result = dict(overrides or {})
+    requested_steps = result.get("steps")
+    result["steps"] = min(requested_steps, DRAFT_STEPS) if requested_steps else DRAFT_STEPS
+    return result
+
+
+def modify_workflow(
+    workflow: Dict[str, Any],
+    prompt: str,
+    width: int,
+    height: int,
+    seed: Optional[int] = None,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Modifies the workflow with the given prompt, width, height and optional parameter overrides."""
     modified_workflow = workflow.copy() # Avoid modifying the original dict
 
     # Modify positive prompt
@@ -228,22 +345,25 @@ def modify_workflow(workflow: Dict[str, Any], prompt: str, width: int, height: i
         modified_workflow[save_image_node_id]["inputs"]["filename_prefix"] = f"{current_date}/ComfyUI"
         logger.info(f"Set filename_prefix to date in node {save_image_node_id}")
 
+    # Apply steps/cfg/sampler/scheduler/batch_size overrides
+    apply_overrides(modified_workflow, overrides)
+
     return modified_workflow
 
 async def modify_i2i_workflow(
     workflow: Dict[str, Any],
-    prompt: str,
+    prompt: Optional[str],
     image_path_or_url: Union[HttpUrl, str, bytes],
     denoise: float = 0.85, # Default denoise value
     seed: Optional[int] = None,
-    client_id: Optional[str] = None # Needed for upload
+    client_id: Optional[str] = None, # Needed for upload
+    overrides: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Modifies an Image-to-Image workflow with the given parameters.
     Handles URL, local path, or image data as bytes.
     Uploads the input image if necessary.
     """
-    modified_workflow = workflow.copy()  # Avoid modifying the original dict
     if client_id is None:
         client_id = str(uuid.uuid4())  # Generate if not provided
 
@@ -254,18 +374,49 @@ async def modify_i2i_workflow(
         logger.error(f"Failed to upload input image: {e}")
         raise # Re-raise the exception to be handled by the caller
 
+    return bind_i2i_inputs(workflow, prompt, uploaded_filename, denoise, seed, overrides)
+
+def bind_i2i_inputs(
+    workflow: Dict[str, Any],
+    prompt: Optional[str],
+    input_image: str,
+    denoise: float = 0.85,
+    seed: Optional[int] = None,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Sets the input image (a name ComfyUI can load, e.g. an uploaded file or an output
+    reference), prompt, denoise, seed and overrides of an Image-to-Image workflow.
+    A prompt of None keeps the workflow's own prompt.
+    """
+    modified_workflow = workflow.copy()  # Avoid modifying the original dict
+
     # 2. Modify LoadImage node
     load_image_node_id = find_load_image_node(modified_workflow)
     if load_image_node_id and "inputs" in modified_workflow[load_image_node_id]:
-        modified_workflow[load_image_node_id]["inputs"]["image"] = uploaded_filename
-        logger.info(f"Set input image to '{uploaded_filename}' in node {load_image_node_id}")
+        modified_workflow[load_image_node_id]["inputs"]["image"] = input_image
+        logger.info(f"Set input image to '{input_image}' in node {load_image_node_id}")
     else:
         logger.error("Could not find LoadImage node to set input image.")
         raise ValueError("Workflow does not contain a suitable LoadImage node.")
 
+    return bind_i2i_parameters(modified_workflow, prompt, denoise, seed, overrides)
+
+def bind_i2i_parameters(
+    workflow: Dict[str, Any],
+    prompt: Optional[str],
+    denoise: float = 0.85,
+    seed: Optional[int] = None,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Sets everything of an Image-to-Image workflow except its input images."""
+    modified_workflow = workflow.copy()  # Avoid modifying the original dict
+
     # 3. Modify positive prompt
     positive_prompt_node_id = find_positive_prompt_node(modified_workflow)
-    if positive_prompt_node_id and "inputs" in modified_workflow[positive_prompt_node_id]:
+    if prompt is None:
+        pass
+    elif positive_prompt_node_id and "inputs" in modified_workflow[positive_prompt_node_id]:
         modified_workflow[positive_prompt_node_id]["inputs"]["text"] = prompt
         logger.info(f"Set positive prompt in node {positive_prompt_node_id}")
     else:
@@ -310,11 +461,80 @@ async def modify_i2i_workflow(
         modified_workflow[save_image_node_id]["inputs"]["filename_prefix"] = f"{current_date}/ComfyUI_i2i" # Add i2i suffix
         logger.info(f"Set filename_prefix in node {save_image_node_id}")
 
+    # 7. Apply steps/cfg/sampler/scheduler/batch_size overrides
+    apply_overrides(modified_workflow, overrides)
+
+    return modified_workflow
+
+async def modify_multi_image_workflow(
+    workflow: Dict[str, Any],
+    prompt: Optional[str],
+    images: Dict[str, Union[str, bytes]],
+    denoise: float = 0.85,
+    seed: Optional[int] = None,
+    client_id: Optional[str] = None,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Modifies a workflow with several load image nodes (e.g. reference, mask and style image).
+    images maps load image node IDs or titles to a URL, local path or image bytes.
+
+    All images are read and uploaded concurrently (at most UPLOAD_CONCURRENCY at a time)
+    while prompt, denoise, seed and overrides are applied; the workflow is returned as soon
+    as the last upload lands.
+    """
+    if not images:
+        raise ValueError("No input images given.")
+    if client_id is None:
+        client_id = str(uuid.uuid4())
+
+    # Resolve every target before uploading anything
+    targets = {resolve_load_image_node(workflow, node_ref): source for node_ref, source in images.items()}
+    if len(targets) < len(images):
+        raise ValueError("Several image entries refer to the same load image node.")
+
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def _upload(source: Union[str, bytes]) -> str:
+        async with semaphore:
+            return await upload_image_async(source, client_id)
+
+    uploads = {node_id: asyncio.create_task(_upload(source)) for node_id, source in targets.items()}
+    try:
+        await asyncio.sleep(0)  # Let the uploads start their I/O before patching the graph
+        modified_workflow = bind_i2i_parameters(workflow, prompt, denoise, seed, overrides)
+        uploaded = dict(zip(uploads, await asyncio.gather(*uploads.values())))
+    finally:
+        unfinished = [task for task in uploads.values() if not task.done()]
+        for task in unfinished:
+            task.cancel()  # One upload failed; stop the rest
+        await asyncio.gather(*unfinished, return_exceptions=True)
+
+    for node_id, uploaded_filename in uploaded.items():
+        modified_workflow[node_id].setdefault("inputs", {})["image"] = uploaded_filename
+        logger.info(f"Set input image to '{uploaded_filename}' in node {node_id}")
     return modified_workflow
 
 
 # --- ComfyUI API Interaction ---
 
+INPUT_IMAGE_SIZE_ENTRIES = 1024  # Uploaded images whose size is remembered
+_input_image_sizes: Dict[str, Tuple[int, int]] = {}
+
+def remember_input_image_size(filename: str, image_data: bytes) -> None:
+    """Remembers the size of an uploaded image, so execution estimates can use it as the output resolution."""
+    size = artifact_store.image_size(image_data)
+    if size is None:
+        return
+    _input_image_sizes.pop(filename, None)
+    _input_image_sizes[filename] = size
+    while len(_input_image_sizes) > INPUT_IMAGE_SIZE_ENTRIES:
+        _input_image_sizes.pop(next(iter(_input_image_sizes)))
+
+def input_image_size(filename: Any) -> Optional[Tuple[int, int]]:
+    """(width, height) of an image uploaded by this process, or None if unknown."""
+    return _input_image_sizes.get(filename) if isinstance(filename, str) else None
+
 async def upload_image_async(image_path_or_url: Union[str, bytes], client_id: str) -> str:
     """
     Uploads an image to ComfyUI's /upload/image endpoint.
@@ -324,14 +544,29 @@ async def upload_image_async(image_path_or_url: Union[str, bytes], client_id: st
     upload_url = f"{COMFYUI_API_BASE}/upload/image"
     image_filename = "uploaded_image.png"  # Default filename for byte data
 
-    async with aiohttp.ClientSession() as session:
+    timeout = aiohttp.ClientTimeout(total=300, sock_connect=resilience.CONNECT_TIMEOUT)
+    store = artifact_store.get_store()
+    async with aiohttp.ClientSession(timeout=timeout) as session:
         try:
             if isinstance(image_path_or_url, bytes):
                 # Handle image data as bytes
                 image_data = image_path_or_url
                 logger.info(f"Uploading image data from bytes ({len(image_data)} bytes)")
             elif isinstance(image_path_or_url, str):
-                if urlparse(image_path_or_url).scheme in ['http', 'https']:
+                digest = None
+                if store:
+                    try:
+                        digest = store.resolve_ref(image_path_or_url)
+                        image_data = store.read_bytes(digest) if digest else None
+                    except (OSError, sqlite3.Error) as e:
+                        logger.warning(f"Could not read {image_path_or_url} from the artifact store: {e}")
+                        digest = None
+                if digest:
+                    # Output of an earlier generation, already held locally
+                    logger.info(f"Read {len(image_data)} bytes from artifact store ({digest}) for {image_path_or_url}")
+                    view_filename = parse_qs(urlparse(image_path_or_url).query).get("filename")
+                    image_filename = view_filename[0] if view_filename else image_filename
+                elif urlparse(image_path_or_url).scheme in ['http', 'https']:
                     # Handle URL
                     logger.info(f"Downloading image from URL: {image_path_or_url}")
                     async with session.get(image_path_or_url) as resp:
@@ -351,27 +586,59 @@ async def upload_image_async(image_path_or_url: Union[str, bytes], client_id: st
             else:
                 raise ValueError(f"Unsupported image_path_or_url type: {type(image_path_or_url)}")
 
-            # Prepare multipart form data
-            form_data = aiohttp.FormData()
-            form_data.add_field('image', image_data, filename=image_filename)
-            # Add other potential fields like 'overwrite' if needed
-            form_data.add_field('overwrite', 'true')  # Overwrite if exists
-
-            logger.info(f"Uploading image '{image_filename}' to {upload_url}")
-            async with session.post(upload_url, data=form_data) as response:
-                response.raise_for_status()
-                result = await response.json()
-                logger.info(f"Upload response: {result}")
-
-                if "name" not in result:
-                    raise ValueError("Invalid response from /upload/image endpoint: 'name' missing")
-
-                # ComfyUI might rename the file, use the name from the response
-                uploaded_filename = result["name"]
-                # subfolder = result.get("subfolder", "")  # Get subfolder if present
-                logger.info(f"Image uploaded successfully as: {uploaded_filename}")
-                return uploaded_filename  # Return the name ComfyUI uses
-
+            # Name uploads by content so an overwrite never changes what a name refers to
+            content_digest = hashlib.sha256(image_data).hexdigest()
+            image_filename = f"{content_digest[:16]}_{image_filename}"
+            upload_key = f"{COMFYUI_API_BASE}:{content_digest}" if store is not None else None
+            cached_name = None
+            if upload_key:
+                try:
+                    cached_name = store.cache.get(artifact_store.UPLOAD_NAMESPACE, upload_key)
+                except sqlite3.Error as e:
+                    logger.warning(f"Upload cache unavailable, uploading without it: {e}")
+                    upload_key = None
+            # Uploaded before, possibly by another server process; the input directory may have been wiped since
+            if cached_name and await input_image_exists_async(session, cached_name):
+                logger.info(f"Image already uploaded as: {cached_name}")
+                remember_input_image_size(cached_name, image_data)
+                return cached_name
+            if cached_name:
+                logger.info(f"Previously uploaded {cached_name} is gone from ComfyUI, uploading again")
+
+            async def _post_upload() -> Dict[str, Any]:
+                # Prepare multipart form data (rebuilt per attempt, a FormData can only be sent once)
+                form_data = aiohttp.FormData()
+                form_data.add_field('image', image_data, filename=image_filename)
+                # Add other potential fields like 'overwrite' if needed
+                form_data.add_field('overwrite', 'true')  # Overwrite if exists
+
+                logger.info(f"Uploading image '{image_filename}' to {upload_url}")
+                async with session.post(upload_url, data=form_data) as response:
+                    response.raise_for_status()
+                    return await response.json()
+
+            # Uploads overwrite by name, so retrying them is safe
+            result = await resilience.call_backend(COMFYUI_API_BASE, _post_upload, idempotent=True)
+            logger.info(f"Upload response: {result}")
+
+            if "name" not in result:
+                raise ValueError("Invalid response from /upload/image endpoint: 'name' missing")
+
+            # ComfyUI might rename the file, use the name from the response
+            uploaded_filename = result["name"]
+            # subfolder = result.get("subfolder", "")  # Get subfolder if present
+            logger.info(f"Image uploaded successfully as: {uploaded_filename}")
+            remember_input_image_size(uploaded_filename, image_data)
+            if upload_key:
+                try:
+                    # Replaces a stale entry as well
+                    store.cache.put(artifact_store.UPLOAD_NAMESPACE, upload_key, uploaded_filename)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not remember upload of {uploaded_filename}: {e}")
+            return uploaded_filename  # Return the name ComfyUI uses
+
+        except resilience.BackendUnavailableError:
+            raise
         except aiohttp.ClientError as e:
             logger.error(f"Network error during image upload/download: {e}")
             raise ConnectionError(f"Could not connect or download/upload image: {e}") from e
@@ -382,6 +649,16 @@ async def upload_image_async(image_path_or_url: Union[str, bytes], client_id: st
             logger.error(f"An unexpected error occurred during image upload: {e}")
             raise RuntimeError("Failed to upload image to ComfyUI") from e
 
+async def input_image_exists_async(session: aiohttp.ClientSession, filename: str) -> bool:
+    """True if ComfyUI still has filename in its input directory (HEAD /view, no body is transferred)."""
+    view_url = f"{COMFYUI_API_BASE}/view?{urlencode({'filename': filename, 'type': 'input'})}"
+    try:
+        async with session.head(view_url) as response:
+            return response.status == 200
+    except aiohttp.ClientError as e:
+        logger.warning(f"Could not check uploaded image {filename}: {e}")
+        return False
+
 async def queue_prompt_async(prompt_workflow: Dict[str, Any], client_id: str) -> str:
     """Submits a workflow to the ComfyUI queue via HTTP POST."""
     # Disable proxy for localhost requests
@@ -392,10 +669,15 @@ async def queue_prompt_async(prompt_workflow: Dict[str, Any], client_id: str) ->
     headers = {'Content-Type': 'application/json'}
     url = f"{COMFYUI_API_BASE}/prompt"
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
+    async with httpx.AsyncClient(timeout=resilience.HTTP_TIMEOUT) as client:
+        async def _post_prompt() -> httpx.Response:
             response = await client.post(url, json=payload, headers=headers)
             response.raise_for_status() # Raise exception for bad status codes
+            return response
+
+        try:
+            # Not retried: a lost response could mean the prompt was queued twice
+            response = await resilience.call_backend(COMFYUI_API_BASE, _post_prompt)
             result = response.json()
             if "prompt_id" not in result:
                 raise ValueError("Invalid response from /prompt endpoint: 'prompt_id' missing")
@@ -414,10 +696,14 @@ async def queue_prompt_async(prompt_workflow: Dict[str, Any], client_id: str) ->
 async def get_history_async(prompt_id: str) -> Dict[str, Any]:
     """Fetches the execution history for a given prompt_id."""
     url = f"{COMFYUI_API_BASE}/history/{prompt_id}"
-    async with httpx.AsyncClient() as client:
-        try:
+    async with httpx.AsyncClient(timeout=resilience.HTTP_TIMEOUT) as client:
+        async def _get_history() -> httpx.Response:
             response = await client.get(url)
             response.raise_for_status()
+            return response
+
+        try:
+            response = await resilience.call_backend(COMFYUI_API_BASE, _get_history, idempotent=True)
             history = response.json()
             if prompt_id not in history:
                  raise ValueError(f"Prompt ID {prompt_id} not found in history response.")
@@ -458,6 +744,9 @@ async def get_history_async(prompt_id: str) -> Dict[str, Any]:
 def wait_for_prompt_completion(ws_url: str, client_id: str, prompt_id: str) -> None:
     """Connects to WebSocket and waits for the execution complete signal."""
     uri = f"{ws_url}?clientId={client_id}"
+    breaker = resilience.get_breaker(COMFYUI_API_BASE)
+    estimator = eta.get_estimator()
+    errors = []  # Exceptions raised in callbacks are swallowed by websocket-client
     
     def on_message(ws, message):
         if isinstance(message, str):
@@ -472,92 +761,180 @@ def wait_for_prompt_completion(ws_url: str, client_id: str, prompt_id: str) -> N
                 
                 # 添加超时判断逻辑
                 if 'queue_remaining' in status_data and status_data['queue_remaining'] == 0:
+                    estimator.mark_finished(prompt_id)
                     ws.close()
                     logger.info("No remaining prompts in queue, closing WebSocket.")
             elif msg_type == 'progress':
+                if msg_prompt_id == prompt_id:
+                    estimator.mark_started(prompt_id)  # In case execution_start preceded the connection
                 value = data.get('value', 0)
                 max_val = data.get('max', 1)
                 if max_val > 0 and msg_prompt_id == prompt_id:
                     logger.info(f"Progress for {prompt_id}: {value}/{max_val} ({(value/max_val)*100:.1f}%)")
+            elif msg_type == 'execution_start' and msg_prompt_id == prompt_id:
+                estimator.mark_started(prompt_id)
             elif msg_type == 'executing':
+                if data.get('node') is not None and msg_prompt_id == prompt_id:
+                    estimator.mark_started(prompt_id)  # In case execution_start preceded the connection
                 if data.get('node') is None and msg_prompt_id == prompt_id:
                     logger.info(f"Execution finished signal received for prompt ID: {prompt_id}")
+                    estimator.mark_finished(prompt_id)
                     ws.close()  # Execution is done for our prompt
             elif msg_type == 'execution_error' and msg_prompt_id == prompt_id:
                 logger.error(f"Execution error for prompt {prompt_id}: {data}")
                 raise RuntimeError(f"ComfyUI execution error: {data.get('exception_message', 'Unknown error')}")
             elif msg_type == 'execution_complete' and msg_prompt_id == prompt_id:
                 logger.info(f"Execution complete signal received for prompt ID: {prompt_id}")
+                estimator.mark_finished(prompt_id)
                 ws.close()
 
     def on_error(ws, error):
         logger.error(f"WebSocket error: {error}")
-        raise ConnectionError(f"WebSocket error: {error}")
+        errors.append(error)
 
     def on_close(ws, close_status_code, close_msg):
         logger.info("WebSocket connection closed")
 
+    breaker.before_call()
     try:
         ws = websocket.WebSocketApp(uri,
                                   on_message=on_message,
                                   on_error=on_error,
                                   on_close=on_close)
         logger.info(f"Connecting to WebSocket: {uri}")
-        ws.run_forever()
+        # Bounded connect timeout, and pings so a backend that dies mid-render is noticed
+        websocket.setdefaulttimeout(resilience.CONNECT_TIMEOUT)
+        ws.run_forever(ping_interval=WS_PING_INTERVAL, ping_timeout=WS_PING_TIMEOUT)
     except Exception as e:
+        breaker.record_failure()
         logger.error(f"Failed to connect to WebSocket {uri}: {e}")
         raise ConnectionError(f"Failed to connect to WebSocket {uri}") from e
 
+    for error in errors:
+        if isinstance(error, RuntimeError):
+            breaker.record_success()
+            raise error
+    if errors:
+        breaker.record_failure()
+        raise ConnectionError(f"WebSocket error while waiting for prompt {prompt_id}: {errors[0]}")
+    breaker.record_success()
 
-def extract_output_info(history: Dict[str, Any]) -> Optional[Tuple[str, str]]:
-    """Extracts filename and subfolder from the history outputs."""
+
+def extract_output_images(history: Dict[str, Any]) -> list[Tuple[str, str]]:
+    """Extracts (filename, subfolder) of every output image in the history, e.g. a whole batch."""
+    output_images = []
     outputs = history.get("outputs", {})
     for node_id, node_output in outputs.items():
-        if "images" in node_output:
-            images = node_output["images"]
-            if images:
-                # Return the first image found
-                image_info = images[0]
-                filename = image_info.get("filename")
-                subfolder = image_info.get("subfolder", "") # Subfolder might be empty
-                file_type = image_info.get("type", "output") # Usually 'output'
-
-                if filename and file_type == 'output': # Ensure it's an output image
-                    logger.info(f"Found output image: filename={filename}, subfolder={subfolder}")
-                    return filename, subfolder
-    logger.warning("No output image found in history.")
-    return None
+        for image_info in node_output.get("images", []):
+            filename = image_info.get("filename")
+            subfolder = image_info.get("subfolder", "") # Subfolder might be empty
+            file_type = image_info.get("type", "output") # Usually 'output'
+
+            if filename and file_type == 'output': # Skip temp/preview images
+                output_images.append((filename, subfolder))
+    if output_images:
+        logger.info(f"Found {len(output_images)} output image(s): {output_images}")
+    else:
+        logger.warning("No output image found in history.")
+    return output_images
+
+def extract_output_info(history: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Extracts filename and subfolder of the first output image from the history outputs."""
+    output_images = extract_output_images(history)
+    return output_images[0] if output_images else None
+
+def build_view_url(filename: str, subfolder: str = "") -> str:
+    """Builds the ComfyUI /view URL for an output image."""
+    if subfolder:
+        query_params = {"subfolder": subfolder}
+        query_params["filename"] = filename
+    else:
+        query_params = {"filename": filename}
+
+    # Ensure type=output is included if needed, though often default
+    # query_params["type"] = "output"
+    return f"{COMFYUI_API_BASE}/view?{urlencode(query_params)}"
+
+def is_backend_view_url(url: str) -> bool:
+    """True if url is a /view URL of the configured ComfyUI backend."""
+    parsed, backend = urlparse(url), urlparse(COMFYUI_API_BASE)
+    return (
+        parsed.scheme == backend.scheme
+        and parsed.netloc == backend.netloc
+        and parsed.path == f"{backend.path.rstrip('/')}/view"
+    )
+
+async def store_output_async(view_url: str, refresh: bool = True) -> Optional[str]:
+    """
+    Pulls an output image into the local artifact store once, keyed by its view URL.
+    Returns the content digest, or None if the store is disabled or the download failed.
+    Only /view URLs of COMFYUI_API_BASE are fetched, the download counts against its circuit breaker.
+    """
+    store = artifact_store.get_store()
+    if store is None:
+        return None
+    if not is_backend_view_url(view_url):
+        logger.warning(f"Not storing {view_url}: not a view URL of {COMFYUI_API_BASE}")
+        return None
+    try:
+        return await resilience.call_backend(
+            COMFYUI_API_BASE, lambda: store.fetch(view_url, refresh=refresh), idempotent=True
+        )
+    except Exception as e:
+        # The store is only a cache; the view URL is still usable
+        logger.warning(f"Could not store output {view_url} locally: {e}")
+        return None
+
+def build_output_reference(filename: str, subfolder: str = "") -> str:
+    """
+    Returns an annotated path ("subfolder/name.png [output]") that LoadImage and
+    LoadImageOutput nodes resolve against ComfyUI's output directory.
+    """
+    path = f"{subfolder}/{filename}" if subfolder else filename
+    return f"{path} [output]"
 
 # --- Main Function ---
 
-async def generate_image_async(workflow: Dict[str, Any]) -> str:
+async def generate_image_async(
+    workflow: Dict[str, Any], deadline_seconds: Optional[float] = None, workflow_name: Optional[str] = None
+) -> str:
     """
     Generates an image using the provided workflow and returns the preview URL.
+    With deadline_seconds, the request is rejected up front if it is not expected to finish in time.
+    workflow_name keys the execution time statistics.
     """
-    client_id = str(uuid.uuid4())
-    logger.info(f"Starting image generation with client_id: {client_id}")
+    view_urls = await generate_images_async(workflow, deadline_seconds, workflow_name)
+    return view_urls[0]
+
+async def generate_images_async(
+    workflow: Dict[str, Any], deadline_seconds: Optional[float] = None, workflow_name: Optional[str] = None
+) -> list[str]:
+    """Like generate_image_async, but returns the preview URLs of all output images (e.g. a batch)."""
+    if deadline_seconds is not None:
+        await check_admission_async(workflow, deadline_seconds, workflow_name)
+    view_urls = []
+    for filename, subfolder in await execute_workflow_images_async(workflow, workflow_name):
+        view_url = build_view_url(filename, subfolder)
+        logger.info(f"Image generation successful. View URL: {view_url}")
+        await store_output_async(view_url)
+        view_urls.append(view_url)
+    return view_urls
+
+async def execute_workflow_async(workflow: Dict[str, Any], workflow_name: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Runs the workflow on ComfyUI and returns (filename, subfolder) of its first output image.
+    The image itself stays on the ComfyUI host.
+    """
+    return (await execute_workflow_images_async(workflow, workflow_name))[0]
 
+async def execute_workflow_images_async(workflow: Dict[str, Any], workflow_name: Optional[str] = None) -> list[Tuple[str, str]]:
+    """Runs the workflow on ComfyUI and returns (filename, subfolder) of all its output images."""
     try:
-        prompt_id = await queue_prompt_async(workflow, client_id)
-        wait_for_prompt_completion(WS_URL, client_id, prompt_id)
-        history = await get_history_async(prompt_id)
-        output_info = extract_output_info(history)
-
-        if output_info:
-            filename, subfolder = output_info
-            # Construct the view URL
-            if subfolder:
-                query_params = {"subfolder": subfolder}
-                query_params["filename"] = filename
-                # query_params = {"subfolder": subfolder}
-            else:
-                query_params = {"filename": filename}
-            
-            # Ensure type=output is included if needed, though often default
-            # query_params["type"] = "output"
-            view_url = f"{COMFYUI_API_BASE}/view?{urlencode(query_params)}"
-            logger.info(f"Image generation successful. View URL: {view_url}")
-            return view_url
+        history = await run_prompt_async(workflow, workflow_name=workflow_name)
+        output_images = extract_output_images(history)
+
+        if output_images:
+            return output_images
         else:
             raise RuntimeError("Image generation completed but no output image found in history.")
 
@@ -569,6 +946,258 @@ async def generate_image_async(workflow: Dict[str, Any]) -> str:
         logger.exception("An unexpected error occurred during image generation.")
         raise RuntimeError("An unexpected error occurred during image generation.") from e
 
+async def run_prompt_async(
+    workflow: Dict[str, Any], background: bool = False, workflow_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Queues the workflow, waits for it to finish and returns its history entry.
+    Background prompts (e.g. warm-up) are not counted as client traffic and do not feed the
+    execution time estimates, which are kept per workflow_name.
+    """
+    global active_prompts, last_activity_at
+    client_id = str(uuid.uuid4())
+    logger.info(f"Starting image generation with client_id: {client_id}")
+
+    # Background prompts are throwaway and not worth journaling
+    journal_db = None if background else journal.get_journal()
+    request_hash = journal.canonical_request_hash(workflow) if journal_db else None
+
+    if not background:
+        active_prompts += 1
+    try:
+        if journal_db:
+            # A retried request picks up the prompt submitted before a restart
+            history = await reattach_prompt_async(journal_db, request_hash)
+            if history is not None:
+                return history
+
+        # Held while ComfyUI is busy, so prompts sharing a model run back to back
+        scheduler = get_prompt_scheduler()
+        estimator = eta.get_estimator()
+        if not background:
+            estimator.hold(client_id, workflow, workflow_name)
+        try:
+            prompt_id = await scheduler.submit(workflow, client_id)
+        finally:
+            estimator.release(client_id)
+        if journal_db:
+            journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, journal.QUEUED)
+        if not background:
+            # Tiny warm-up renders would drag down the estimates of real ones
+            estimator.track(prompt_id, workflow, workflow_name)
+        try:
+            # Wait in a dedicated worker thread so other tool calls can be queued in the meantime
+            await asyncio.get_running_loop().run_in_executor(
+                _ws_wait_executor, wait_for_prompt_completion, WS_URL, client_id, prompt_id
+            )
+            history = await get_history_async(prompt_id)
+        except RuntimeError:
+            # Execution error; connection errors keep the prompt 'queued' so a retry can reattach
+            if journal_db:
+                journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, journal.FAILED)
+            raise
+        finally:
+            estimator.forget(prompt_id)  # No-op once completion was recorded
+            scheduler.notify_finished()
+        if journal_db:
+            journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, journal.COMPLETED)
+        return history
+    finally:
+        if not background:
+            active_prompts -= 1
+            last_activity_at = time.monotonic()
+
+def get_prompt_scheduler() -> prompt_scheduler.AffinityScheduler:
+    return prompt_scheduler.get_scheduler(queue_prompt_async, get_queue_async)
+
+@contextmanager
+def request_seed(params: Dict[str, Any], seed: Optional[int] = None) -> Iterator[int]:
+    """
+    Resolves the seed of a tool call. An explicit seed is used as is. Without one, a retry of
+    a call that was interrupted by a restart gets the seed of that call, so its workflow hashes
+    the same and reattaches to the prompt already journaled; otherwise a random seed is drawn.
+    """
+    if seed is not None:
+        yield seed
+        return
+    journal_db = journal.get_journal()
+    if journal_db is None:
+        yield random.randint(1, 999999999)
+        return
+    key = journal.request_key(params)
+    seed = journal_db.take_orphaned_seed(key, COMFYUI_API_BASE)
+    if seed is not None:
+        logger.info(f"Reusing seed {seed} of an interrupted identical request")
+    else:
+        seed = random.randint(1, 999999999)
+    journal_db.record_seed(key, COMFYUI_API_BASE, seed)
+    try:
+        yield seed
+    except asyncio.CancelledError:
+        # The client went away, but the prompt keeps running; let a retry pick it up
+        journal_db.release_seed(key, COMFYUI_API_BASE, seed, reusable=True)
+        raise
+    except BaseException:
+        journal_db.release_seed(key, COMFYUI_API_BASE, seed)
+        raise
+    journal_db.release_seed(key, COMFYUI_API_BASE, seed)
+
+async def check_admission_async(
+    workflow: Dict[str, Any], deadline_seconds: float, workflow_name: Optional[str] = None
+) -> None:
+    """Raises eta.DeadlineExceededError if the workflow is not expected to complete within the deadline."""
+    queue = await get_queue_async()
+    expected = eta.get_estimator().estimate_new_prompt(queue, workflow, workflow_name)
+    if expected > deadline_seconds:
+        raise eta.DeadlineExceededError(
+            f"Expected completion in {expected:.0f}s exceeds the deadline of {deadline_seconds:.0f}s; request not queued."
+        )
+    logger.info(f"Admitted prompt, expected completion in {expected:.0f}s (deadline {deadline_seconds:.0f}s)")
+
+async def estimate_queue_async() -> list[Dict[str, Any]]:
+    """Returns expected start time and ETA (seconds from now) for every prompt queued on ComfyUI."""
+    return eta.get_estimator().estimate_queue(await get_queue_async())
+
+def history_has_error(history: Dict[str, Any]) -> bool:
+    return history.get("status", {}).get("status_str") == "error"
+
+async def prompt_in_queue_async(prompt_id: str) -> bool:
+    """True if prompt_id is running or pending on ComfyUI."""
+    queue = await get_queue_async()
+    entries = queue.get("queue_running", []) + queue.get("queue_pending", [])
+    return any(len(entry) > 1 and entry[1] == prompt_id for entry in entries)
+
+async def wait_for_history_async(prompt_id: str) -> Dict[str, Any]:
+    """
+    Polls until prompt_id shows up in /history. Used for prompts submitted by another
+    client_id (e.g. before a restart), whose websocket events we cannot receive.
+    Raises RuntimeError if the prompt is neither queued nor in history.
+    """
+    while True:
+        try:
+            return await get_history_async(prompt_id)
+        except ValueError:
+            pass
+        if not await prompt_in_queue_async(prompt_id):
+            try:
+                # It may have finished between the two calls
+                return await get_history_async(prompt_id)
+            except ValueError:
+                raise RuntimeError(f"Prompt {prompt_id} is neither queued nor in history")
+        await asyncio.sleep(HISTORY_POLL_SECONDS)
+
+async def reattach_prompt_async(journal_db: journal.PromptJournal, request_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the history of an earlier prompt with the same request hash, waiting for it if it
+    is still queued. Returns None if there is none or it can no longer be recovered.
+    """
+    record = journal_db.find_latest(request_hash, COMFYUI_API_BASE)
+    if record is None:
+        return None
+    prompt_id = record["prompt_id"]
+    logger.info(f"Reattaching to journaled prompt {prompt_id} ({record['event']})")
+    try:
+        history = await wait_for_history_async(prompt_id)
+    except RuntimeError as e:
+        logger.info(f"Journaled prompt {prompt_id} cannot be recovered: {e}")
+        journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, journal.LOST)
+        return None
+    if history_has_error(history) or extract_output_info(history) is None:
+        journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, journal.FAILED)
+        return None
+    if record["event"] != journal.COMPLETED:
+        journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, journal.COMPLETED)
+    return history
+
+async def reconcile_journal_async() -> None:
+    """
+    Checks prompts journaled as 'queued' against /history and /queue after a restart,
+    marking them completed, failed or lost. Prompts still queued are left for reattachment.
+    """
+    journal_db = journal.get_journal()
+    if journal_db is None:
+        return
+    for record in journal_db.pending(COMFYUI_API_BASE):
+        prompt_id, request_hash = record["prompt_id"], record["request_hash"]
+        try:
+            history = await get_history_async(prompt_id)
+            event = journal.FAILED if history_has_error(history) else journal.COMPLETED
+        except ValueError:
+            if await prompt_in_queue_async(prompt_id):
+                continue
+            event = journal.LOST
+        journal_db.append(prompt_id, request_hash, COMFYUI_API_BASE, event)
+        logger.info(f"Reconciled journaled prompt {prompt_id}: {event}")
+
+async def get_queue_async() -> Dict[str, Any]:
+    """Fetches ComfyUI's running and pending queue."""
+    url = f"{COMFYUI_API_BASE}/queue"
+    async with httpx.AsyncClient(timeout=resilience.HTTP_TIMEOUT) as client:
+        async def _get_queue() -> httpx.Response:
+            response = await client.get(url)
+            response.raise_for_status()
+            return response
+
+        try:
+            response = await resilience.call_backend(COMFYUI_API_BASE, _get_queue, idempotent=True)
+            return response.json()
+        except httpx.RequestError as e:
+            logger.error(f"HTTP request error to {url}: {e}")
+            raise ConnectionError(f"Could not connect to ComfyUI API at {url}") from e
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error from {url}: {e.response.status_code} - {e.response.text}")
+            raise ConnectionError(f"ComfyUI API returned error: {e.response.status_code}") from e
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON response from {url}: {e}")
+            raise ValueError("Invalid JSON response from ComfyUI API") from e
+
+async def run_pipeline_async(
+    stages: list[Dict[str, Any]],
+    image_path_or_url: Optional[Union[str, bytes]] = None
+) -> str:
+    """
+    Runs several workflows in sequence on the same ComfyUI backend and returns the view URL
+    of the last stage's output.
+
+    Each stage is a dict with 'workflow_name' and optional 'prompt', 'width', 'height',
+    'seed', 'denoise' and override keys (see OVERRIDE_ROLES). From the second stage on, the
+    previous output is fed into the stage's load image node by output reference, so no
+    image bytes leave the ComfyUI host between stages. If the first stage loads an image,
+    image_path_or_url is uploaded for it.
+    """
+    if not stages:
+        raise ValueError("Pipeline must contain at least one stage.")
+
+    previous_output: Optional[Tuple[str, str]] = None
+    for index, stage in enumerate(stages):
+        if "workflow_name" not in stage:
+            raise ValueError(f"Pipeline stage {index} is missing 'workflow_name'.")
+        workflow = load_workflow(stage["workflow_name"])
+        overrides = {name: stage.get(name) for name in OVERRIDE_ROLES}
+        prompt = stage.get("prompt")
+        seed = stage.get("seed")
+        denoise = stage.get("denoise", 1.0)
+
+        if previous_output is not None:
+            image_ref = build_output_reference(*previous_output)
+            workflow = bind_i2i_inputs(workflow, prompt, image_ref, denoise, seed, overrides)
+        elif find_load_image_node(workflow) is not None:
+            if image_path_or_url is None:
+                raise ValueError(f"Pipeline stage 0 ('{stage['workflow_name']}') needs an input image.")
+            workflow = await modify_i2i_workflow(workflow, prompt, image_path_or_url, denoise, seed, overrides=overrides)
+        else:
+            if prompt is None:
+                raise ValueError(f"Pipeline stage 0 ('{stage['workflow_name']}') needs a prompt.")
+            workflow = modify_workflow(workflow, prompt, stage.get("width", 1024), stage.get("height", 1024), seed, overrides)
+
+        logger.info(f"Running pipeline stage {index + 1}/{len(stages)}: {stage['workflow_name']}")
+        previous_output = await execute_workflow_async(workflow, stage["workflow_name"])
+
+    view_url = build_view_url(*previous_output)
+    logger.info(f"Pipeline finished. View URL: {view_url}")
+    await store_output_async(view_url)
+    return view_url
+
 # Example Usage (for testing this module directly)
 async def test_modify_t2i_workflow():
     try:
@@ -0,0 +1,212 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    from . import comfyui_client
+    from .prompt_scheduler import workflow_affinity_key
+except ImportError:
+    from hh_mcp_comfyui import comfyui_client
+    from hh_mcp_comfyui.prompt_scheduler import workflow_affinity_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXECUTION_SECONDS = float(os.getenv("COMFYUI_DEFAULT_EXECUTION_SECONDS", "30"))  # Before any sample exists
+EWMA_ALPHA = 0.3
+SAMPLE_WINDOW = 200  # Recent samples kept per key for percentiles
+ADMISSION_PERCENTILE = 90
+
+class DeadlineExceededError(ValueError):
+    """Raised at admission when a prompt is not expected to finish within its deadline."""
+
+# --- Streaming Statistics ---
+
+class StreamingStats:
+    """EWMA plus percentiles over a bounded window of recent samples."""
+
+    def __init__(self, alpha: float = EWMA_ALPHA, window: int = SAMPLE_WINDOW):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.count = 0
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def add(self, value: float) -> None:
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+        self.count += 1
+        self.samples.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "ewma": self.ewma,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+# --- Estimator ---
+
+def output_resolution(workflow: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """
+    Returns the literal size of the empty latent or, for image-to-image workflows, the size of
+    the uploaded input image (about 1 megapixel if a node rescales it to that). None if unknown.
+    """
+    load_image_size = None
+    megapixel_scale = False
+    for node_data in workflow.values():
+        class_type = node_data.get("class_type")
+        inputs = node_data.get("inputs", {})
+        if class_type in comfyui_client.LATENT_IMAGE_TYPES:
+            width, height = inputs.get("width"), inputs.get("height")
+            if isinstance(width, int) and isinstance(height, int):
+                return width, height
+        elif class_type in comfyui_client.LOAD_IMAGE_TYPES and load_image_size is None:
+            load_image_size = comfyui_client.input_image_size(inputs.get("image"))
+        elif class_type in comfyui_client.MEGAPIXEL_SCALE_TYPES:
+            megapixel_scale = True
+    if load_image_size and megapixel_scale:
+        width, height = load_image_size
+        scale = math.sqrt(1024 * 1024 / (width * height))
+        return max(64, round(width * scale / 64) * 64), max(64, round(height * scale / 64) * 64)
+    return load_image_size
+
+def estimate_key(workflow: Dict[str, Any], workflow_name: Optional[str] = None) -> str:
+    """Groups prompts by workflow, loaded model and output resolution."""
+    model_key, _ = workflow_affinity_key(workflow)
+    resolution = output_resolution(workflow)
+    resolution_key = f"{resolution[0]}x{resolution[1]}" if resolution else "any"
+    return f"{workflow_name or '-'}:{model_key}:{resolution_key}"
+
+class ExecutionEstimator:
+    """
+    Learns per-workflow, per-resolution execution and queue-wait times from websocket
+    events, and estimates start time and completion for queued prompts.
+    """
+
+    def __init__(self):
+        self.execution: Dict[str, StreamingStats] = {}
+        self.queue_wait: Dict[str, StreamingStats] = {}
+        self._prompts: Dict[str, Dict[str, Any]] = {}  # prompt_id -> key and timestamps
+        self._held: Dict[str, str] = {}  # client_id -> key of prompts held locally before submission
+        self._lock = threading.Lock()  # Websocket callbacks run in worker threads
+
+    def hold(self, client_id: str, workflow: Dict[str, Any], workflow_name: Optional[str] = None) -> None:
+        """Counts a prompt that waits locally to be submitted, see held_backlog."""
+        with self._lock:
+            self._held[client_id] = estimate_key(workflow, workflow_name)
+
+    def release(self, client_id: str) -> None:
+        with self._lock:
+            self._held.pop(client_id, None)
+
+    def track(self, prompt_id: str, workflow: Dict[str, Any], workflow_name: Optional[str] = None) -> None:
+        with self._lock:
+            self._prompts[prompt_id] = {"key": estimate_key(workflow, workflow_name), "submitted_at": time.monotonic()}
+
+    def mark_started(self, prompt_id: str) -> None:
+        with self._lock:
+            record = self._prompts.get(prompt_id)
+            if record is None or "started_at" in record:
+                return
+            record["started_at"] = time.monotonic()
+            wait = record["started_at"] - record["submitted_at"]
+            self.queue_wait.setdefault(record["key"], StreamingStats()).add(wait)
+
+    def mark_finished(self, prompt_id: str) -> None:
+        with self._lock:
+            record = self._prompts.pop(prompt_id, None)
+            if record is None or "started_at" not in record:
+                return
+            duration = time.monotonic() - record["started_at"]
+            self.execution.setdefault(record["key"], StreamingStats()).add(duration)
+            logger.info(f"Prompt {prompt_id} executed in {duration:.1f}s ({record['key']})")
+
+    def forget(self, prompt_id: str) -> None:
+        """Drops a prompt that will not report completion, e.g. after its websocket wait failed."""
+        with self._lock:
+            self._prompts.pop(prompt_id, None)
+
+    def expected_execution(self, key: str, percentile: Optional[float] = None) -> float:
+        """EWMA (or the given percentile) of execution time for key, with a default before any sample."""
+        with self._lock:
+            stats = self.execution.get(key)
+            if stats is None or stats.ewma is None:
+                return DEFAULT_EXECUTION_SECONDS
+            value = stats.percentile(percentile) if percentile is not None else stats.ewma
+            return value if value is not None else stats.ewma
+
+    def remaining_execution(self, prompt_id: str, key: str) -> float:
+        """Expected remaining time of a prompt, accounting for time it has already run."""
+        expected = self.expected_execution(key)
+        with self._lock:
+            started_at = self._prompts.get(prompt_id, {}).get("started_at")
+        if started_at is None:
+            return expected
+        return max(expected - (time.monotonic() - started_at), 0.0)
+
+    def estimate_queue(self, queue: Dict[str, Any]) -> list[Dict[str, Any]]:
+        """
+        Walks a ComfyUI /queue response in execution order and returns, for every prompt,
+        the expected seconds until it starts and until it completes.
+        """
+        running = queue.get("queue_running", [])
+        pending = sorted(queue.get("queue_pending", []), key=lambda entry: entry[0])
+        elapsed = 0.0
+        estimates = []
+        with self._lock:
+            tracked_keys = {prompt_id: record["key"] for prompt_id, record in self._prompts.items()}
+        for index, entry in enumerate(running + pending):
+            prompt_id, prompt = entry[1], entry[2] if len(entry) > 2 else {}
+            # Prompts submitted here are known by workflow name; others are grouped by graph only
+            key = tracked_keys.get(prompt_id) or (estimate_key(prompt) if isinstance(prompt, dict) else "unknown")
+            if index < len(running):
+                duration = self.remaining_execution(prompt_id, key)
+            else:
+                duration = self.expected_execution(key)
+            estimates.append({
+                "prompt_id": prompt_id,
+                "status": "running" if index < len(running) else "pending",
+                "expected_start_seconds": round(elapsed, 1),
+                "eta_seconds": round(elapsed + duration, 1),
+            })
+            elapsed += duration
+        return estimates
+
+    def held_backlog(self) -> float:
+        """Expected execution time of the prompts held locally, which may be submitted first."""
+        with self._lock:
+            keys = list(self._held.values())
+        return sum(self.expected_execution(key) for key in keys)
+
+    def estimate_new_prompt(self, queue: Dict[str, Any], workflow: Dict[str, Any], workflow_name: Optional[str] = None) -> float:
+        """Conservative (p90) seconds until a prompt submitted now would complete."""
+        estimates = self.estimate_queue(queue)
+        backlog = (estimates[-1]["eta_seconds"] if estimates else 0.0) + self.held_backlog()
+        return backlog + self.expected_execution(estimate_key(workflow, workflow_name), ADMISSION_PERCENTILE)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "execution": {key: stats.summary() for key, stats in self.execution.items()},
+                "queue_wait": {key: stats.summary() for key, stats in self.queue_wait.items()},
+            }
+
+
+_estimator: Optional[ExecutionEstimator] = None
+
+def get_estimator() -> ExecutionEstimator:
+    global _estimator
+    if _estimator is None:
+        _estimator = ExecutionEstimator()
+    return _estimator
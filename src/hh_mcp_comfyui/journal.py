@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from pathlib import Path
+from contextlib import closing
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Empty string disables the journal
+JOURNAL_PATH = os.getenv("COMFYUI_JOURNAL_PATH", str(Path.home() / ".cache" / "hh-mcp-comfyui" / "journal.sqlite3"))
+JOURNAL_RETENTION_SECONDS = float(os.getenv("COMFYUI_JOURNAL_RETENTION_DAYS", "7")) * 86400
+PRUNE_INTERVAL_SECONDS = 3600.0
+SEED_REUSE_SECONDS = 3600.0  # How long a retry may pick up the seed of a request interrupted by a restart
+
+QUEUED = "queued"
+COMPLETED = "completed"
+FAILED = "failed"
+LOST = "lost"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt_id TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    event TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS journal_request ON journal (request_hash, backend);
+CREATE INDEX IF NOT EXISTS journal_prompt ON journal (prompt_id);
+CREATE TABLE IF NOT EXISTS request_seeds (
+    request_key TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    pid INTEGER,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS request_seeds_key ON request_seeds (request_key, backend);
+"""
+
+# --- Request Hashing ---
+
+def canonical_request_hash(workflow: Dict[str, Any]) -> str:
+    """Hashes a prompt workflow independent of key order and UI-only '_meta' data."""
+    canonical = {
+        node_id: {k: v for k, v in node_data.items() if k != "_meta"}
+        for node_id, node_data in workflow.items()
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def request_key(params: Dict[str, Any]) -> str:
+    """Hashes the parameters of a tool call, e.g. to recognise the retry of a request without a seed."""
+    encoded = json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        return False  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# --- Journal ---
+
+class PromptJournal:
+    """
+    Append-only SQLite (WAL mode) journal of submitted prompts.
+
+    Every state change appends a row; the latest row of a prompt_id is its current state.
+    This lets a restarted server find prompts it submitted before dying, and lets a retried
+    request with the same canonical hash pick up the earlier prompt instead of rendering again.
+
+    Requests without a seed get a random one, so their hash differs on every call. While such
+    a request runs, its seed is recorded under the request key with the owning process id;
+    a retry after that process died reuses the seed and therefore reattaches by hash.
+    Rows of finished prompts are pruned after retention_seconds.
+    """
+
+    def __init__(self, path: Path, retention_seconds: float = JOURNAL_RETENTION_SECONDS):
+        self.path = Path(path)
+        self.retention_seconds = retention_seconds
+        self._last_pruned_at = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        self.prune()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, prompt_id: str, request_hash: str, backend: str, event: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO journal (prompt_id, request_hash, backend, event, at) VALUES (?, ?, ?, ?, ?)",
+                (prompt_id, request_hash, backend, event, time.time()),
+            )
+        if time.time() - self._last_pruned_at > PRUNE_INTERVAL_SECONDS:
+            self.prune()
+
+    def prune(self) -> int:
+        """Deletes prompts whose latest event is terminal and older than the retention period."""
+        cutoff = time.time() - self.retention_seconds
+        with closing(self._connect()) as conn, conn:
+            deleted = conn.execute(
+                """
+                DELETE FROM journal WHERE prompt_id IN (
+                    SELECT j.prompt_id FROM journal j
+                    WHERE j.seq = (SELECT MAX(seq) FROM journal WHERE prompt_id = j.prompt_id)
+                      AND j.event IN (?, ?, ?) AND j.at < ?
+                )
+                """,
+                (COMPLETED, FAILED, LOST, cutoff),
+            ).rowcount
+            conn.execute("DELETE FROM request_seeds WHERE at < ?", (time.time() - SEED_REUSE_SECONDS,))
+        self._last_pruned_at = time.time()
+        if deleted:
+            logger.info(f"Pruned {deleted} prompt journal rows older than {self.retention_seconds / 86400:g} days")
+        return deleted
+
+    def take_orphaned_seed(self, request_key: str, backend: str) -> Optional[int]:
+        """
+        Returns the seed of a recent request with this key whose process is gone (e.g. the
+        server was restarted mid-render), removing it so only one retry picks it up.
+        """
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute(
+                "SELECT rowid, seed, pid FROM request_seeds WHERE request_key = ? AND backend = ? AND at >= ? ORDER BY at DESC",
+                (request_key, backend, time.time() - SEED_REUSE_SECONDS),
+            ).fetchall()
+            for rowid, seed, pid in rows:
+                if _process_alive(pid):
+                    continue  # An identical request still running is not a retry
+                if conn.execute("DELETE FROM request_seeds WHERE rowid = ?", (rowid,)).rowcount == 1:
+                    return seed
+        return None
+
+    def record_seed(self, request_key: str, backend: str, seed: int) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO request_seeds (request_key, backend, seed, pid, at) VALUES (?, ?, ?, ?, ?)",
+                (request_key, backend, seed, os.getpid(), time.time()),
+            )
+
+    def release_seed(self, request_key: str, backend: str, seed: int, reusable: bool = False) -> None:
+        """Forgets a request's seed once it returned; reusable=True leaves it for a retry instead."""
+        with closing(self._connect()) as conn, conn:
+            if reusable:
+                conn.execute(
+                    "UPDATE request_seeds SET pid = NULL WHERE request_key = ? AND backend = ? AND seed = ? AND pid = ?",
+                    (request_key, backend, seed, os.getpid()),
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM request_seeds WHERE request_key = ? AND backend = ? AND seed = ? AND pid = ?",
+                    (request_key, backend, seed, os.getpid()),
+                )
+
+    def find_latest(self, request_hash: str, backend: str) -> Optional[Dict[str, Any]]:
+        """Returns the most recent queued or completed prompt for a request, if any."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                """
+                SELECT j.prompt_id, j.event, j.at FROM journal j
+                WHERE j.request_hash = ? AND j.backend = ?
+                  AND j.seq = (SELECT MAX(seq) FROM journal WHERE prompt_id = j.prompt_id)
+                  AND j.event IN (?, ?)
+                ORDER BY j.seq DESC LIMIT 1
+                """,
+                (request_hash, backend, QUEUED, COMPLETED),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"prompt_id": row[0], "event": row[1], "at": row[2]}
+
+    def pending(self, backend: str) -> list[Dict[str, Any]]:
+        """Returns prompts on backend whose latest event is still 'queued'."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                SELECT j.prompt_id, j.request_hash FROM journal j
+                WHERE j.backend = ? AND j.event = ?
+                  AND j.seq = (SELECT MAX(seq) FROM journal WHERE prompt_id = j.prompt_id)
+                """,
+                (backend, QUEUED),
+            ).fetchall()
+        return [{"prompt_id": row[0], "request_hash": row[1]} for row in rows]
+
+
+_journal: Optional[PromptJournal] = None
+
+def get_journal() -> Optional[PromptJournal]:
+    """Returns the process-wide journal, or None if it is disabled or unavailable."""
+    global _journal
+    if not JOURNAL_PATH:
+        return None
+    if _journal is None:
+        try:
+            _journal = PromptJournal(Path(JOURNAL_PATH))
+            logger.info(f"Prompt journal at {JOURNAL_PATH}")
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not open prompt journal at {JOURNAL_PATH}: {e}")
+            return None
+    return _journal
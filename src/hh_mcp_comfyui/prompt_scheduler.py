@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+REORDER_MAX_HOLD_SECONDS = float(os.getenv("COMFYUI_REORDER_MAX_HOLD_SECONDS", "60"))  # 0 submits in arrival order
+QUEUE_POLL_SECONDS = 0.5  # How often ComfyUI's /queue is checked while prompts are held
+
+# Nodes whose inputs decide which weights ComfyUI has to load
+MODEL_LOADER_TYPES = [
+    "CheckpointLoaderSimple",
+    "CheckpointLoader",
+    "BizyAir_CheckpointLoaderSimple",
+    "UNETLoader",
+    "BizyAir_UNETLoader",
+    "CLIPLoader",
+    "DualCLIPLoader",
+    "BizyAir_DualCLIPLoader",
+    "VAELoader",
+    "BizyAir_VAELoader",
+    "LoraLoader",
+    "LoraLoaderModelOnly",
+    "BizyAir_LoraLoader",
+]
+
+# Sampler inputs that reference the negative conditioning
+NEGATIVE_INPUT_NAMES = ["negative"]
+
+# --- Affinity Keys ---
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def _scalar_inputs(node_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the literal inputs of a node, skipping links to other nodes."""
+    return {k: v for k, v in node_data.get("inputs", {}).items() if not isinstance(v, list)}
+
+def find_negative_prompt_text(workflow: Dict[str, Any]) -> Optional[str]:
+    """Follows the sampler's 'negative' link and returns the text of that encoder node."""
+    for node_data in workflow.values():
+        for input_name in NEGATIVE_INPUT_NAMES:
+            link = node_data.get("inputs", {}).get(input_name)
+            if isinstance(link, list) and link and str(link[0]) in workflow:
+                text = workflow[str(link[0])].get("inputs", {}).get("text")
+                if isinstance(text, str):
+                    return text
+    return None
+
+def workflow_affinity_key(workflow: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Returns (model_key, upstream_key) for a workflow.
+
+    model_key identifies the loaded weights (checkpoint, UNET, CLIP, VAE and LoRA loaders);
+    upstream_key additionally covers the negative prompt, so prompts sharing it can reuse
+    ComfyUI's cached conditioning outputs.
+    """
+    loaders = sorted(
+        (node_data.get("class_type", ""), _digest(_scalar_inputs(node_data)))
+        for node_data in workflow.values()
+        if node_data.get("class_type") in MODEL_LOADER_TYPES
+    )
+    if not loaders:
+        # No known loader, fall back to the graph shape so identical workflows still group
+        loaders = sorted(node_data.get("class_type", "") for node_data in workflow.values())
+    model_key = _digest(loaders)
+    upstream_key = _digest([model_key, find_negative_prompt_text(workflow)])
+    return model_key, upstream_key
+
+# --- Affinity Scheduler ---
+
+@dataclass
+class _PendingPrompt:
+    workflow: Dict[str, Any]
+    client_id: str
+    affinity_key: Tuple[str, str]
+    future: asyncio.Future
+    held_since: float
+
+class AffinityScheduler:
+    """
+    Holds prompts locally while ComfyUI is busy and submits them one at a time, best model affinity first.
+
+    ComfyUI runs its queue first in, first out, so a prompt's position is fixed once it is
+    submitted. Prompts are therefore only submitted while ComfyUI's /queue has no running or
+    pending job. When it drains, the held prompt sharing the model (then the upstream subgraph)
+    of the last prompt ComfyUI ran goes next, so interleaved requests for different models run
+    grouped instead of swapping weights on every prompt. A prompt held for max_hold_seconds is
+    submitted even while ComfyUI is busy, oldest first, so no model group starves.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[Dict[str, Any], str], Awaitable[str]],
+        get_queue: Callable[[], Awaitable[Dict[str, Any]]],
+        max_hold_seconds: float,
+        poll_seconds: float = QUEUE_POLL_SECONDS,
+    ):
+        self._submit = submit
+        self._get_queue = get_queue
+        self.max_hold_seconds = max_hold_seconds
+        self.poll_seconds = poll_seconds
+        self._pending: list[_PendingPrompt] = []
+        self._dispatch_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._last_key: Optional[Tuple[str, str]] = None
+
+    async def submit(self, workflow: Dict[str, Any], client_id: str) -> str:
+        """Holds a prompt until it is its turn and returns its prompt_id once ComfyUI has queued it."""
+        affinity_key = workflow_affinity_key(workflow)
+        if self.max_hold_seconds <= 0:
+            prompt_id = await self._submit(workflow, client_id)
+            self._last_key = affinity_key
+            return prompt_id
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingPrompt(workflow, client_id, affinity_key, future, time.monotonic()))
+        if self._dispatch_task is None or self._dispatch_task.done():
+            self._dispatch_task = asyncio.create_task(self._dispatch())
+        return await future
+
+    def notify_finished(self) -> None:
+        """Checks the queue again right away, e.g. after one of our prompts finished."""
+        self._wakeup.set()
+
+    def next_prompt(self) -> _PendingPrompt:
+        """Same model and upstream subgraph as the last prompt first, then same model, then the oldest."""
+        last_model, last_upstream = self._last_key or (None, None)
+        return min(
+            self._pending,
+            key=lambda item: (item.affinity_key[0] != last_model, item.affinity_key[1] != last_upstream),
+        )
+
+    async def _dispatch(self) -> None:
+        """Submits held prompts until none are left."""
+        while True:
+            self._pending = [item for item in self._pending if not item.future.done()]
+            if not self._pending:
+                return
+            deadline = time.monotonic() - self.max_hold_seconds
+            overdue = [item for item in self._pending if item.held_since <= deadline]
+            if overdue:
+                item = overdue[0]
+                logger.info(f"Prompt held for over {self.max_hold_seconds:.0f}s, submitting it behind the busy queue")
+            elif await self._backend_busy():
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            else:
+                item = self.next_prompt()
+            self._pending.remove(item)
+            await self._submit_one(item)
+
+    async def _backend_busy(self) -> bool:
+        """True if ComfyUI has a running or pending job; remembers the model of the last one."""
+        try:
+            queue = await self._get_queue()
+        except Exception as e:
+            logger.warning(f"Could not check the ComfyUI queue, submitting held prompts: {e}")
+            return False
+        entries = queue.get("queue_running", []) + sorted(queue.get("queue_pending", []), key=lambda entry: entry[0])
+        if not entries:
+            return False
+        last_prompt = entries[-1][2] if len(entries[-1]) > 2 else None
+        if isinstance(last_prompt, dict):
+            self._last_key = workflow_affinity_key(last_prompt)
+        return True
+
+    async def _submit_one(self, item: _PendingPrompt) -> None:
+        if self._pending:
+            logger.info(f"Submitting held prompt ({len(self._pending)} still held)")
+        try:
+            prompt_id = await self._submit(item.workflow, item.client_id)
+            self._last_key = item.affinity_key
+            if not item.future.done():
+                item.future.set_result(prompt_id)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+
+
+_scheduler: Optional[AffinityScheduler] = None
+
+def get_scheduler(
+    submit: Callable[[Dict[str, Any], str], Awaitable[str]],
+    get_queue: Callable[[], Awaitable[Dict[str, Any]]],
+) -> AffinityScheduler:
+    """Returns the process-wide scheduler, created on first use with the given backend functions."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = AffinityScheduler(submit, get_queue, REORDER_MAX_HOLD_SECONDS)
+    return _scheduler
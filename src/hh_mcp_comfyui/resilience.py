@@ -0,0 +1,180 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, Callable, Awaitable
+
+import httpx
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv("COMFYUI_CONNECT_TIMEOUT", "5"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("COMFYUI_BREAKER_FAILURES", "3"))
+BREAKER_RECOVERY_SECONDS = float(os.getenv("COMFYUI_BREAKER_RECOVERY_SECONDS", "15"))
+RETRY_ATTEMPTS = int(os.getenv("COMFYUI_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = 0.2  # Seconds, doubled per attempt with full jitter
+RETRY_MAX_DELAY = 2.0
+RETRY_BUDGET_RATIO = 0.2  # Retries allowed per successful call
+RETRY_BUDGET_MAX = 10.0
+
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=CONNECT_TIMEOUT)
+
+# --- Errors ---
+
+class BackendUnavailableError(ConnectionError):
+    """Raised without contacting ComfyUI while the circuit breaker for a backend is open."""
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """True for errors that indicate the backend itself is down, not a bad request."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500
+    return isinstance(exc, (httpx.TransportError, aiohttp.ClientConnectionError,
+                            asyncio.TimeoutError, ConnectionError))
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Per-backend health state machine: closed -> open -> half_open -> closed.
+
+    The breaker opens after failure_threshold consecutive backend failures. While open, calls
+    fail immediately. After recovery_seconds a single probe call is let through (half_open);
+    its success closes the breaker, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, backend: str, failure_threshold: int, recovery_seconds: float):
+        self.backend = backend
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()  # Websocket waits run in worker threads
+
+    def before_call(self) -> None:
+        """Raises BackendUnavailableError if the call must not reach the backend."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.recovery_seconds - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Circuit for {self.backend} half-open, probing backend")
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            retry_in = max(remaining, 0.0)
+        raise BackendUnavailableError(
+            f"ComfyUI backend unavailable at {self.backend} (circuit open, retry in {retry_in:.0f}s)"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.backend} closed, backend recovered")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.backend} opened after {self.failures} failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Lets another probe through after one that ended without a verdict on the backend."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+
+class RetryBudget:
+    """Token bucket that caps retries to a fraction of successful calls."""
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_budgets: Dict[str, RetryBudget] = {}
+
+def get_breaker(backend: str) -> CircuitBreaker:
+    if backend not in _breakers:
+        _breakers[backend] = CircuitBreaker(backend, BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_SECONDS)
+    return _breakers[backend]
+
+def get_retry_budget(backend: str) -> RetryBudget:
+    if backend not in _budgets:
+        _budgets[backend] = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+    return _budgets[backend]
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+async def call_backend(backend: str, operation: Callable[[], Awaitable[Any]], idempotent: bool = False) -> Any:
+    """
+    Runs operation against backend through its circuit breaker.
+
+    Idempotent operations are retried on backend failures with jittered backoff, as long as
+    the backend's retry budget allows it. Non-backend errors (e.g. HTTP 4xx) are raised as is
+    and do not count against the breaker.
+    """
+    breaker = get_breaker(backend)
+    budget = get_retry_budget(backend)
+    attempts = max(RETRY_ATTEMPTS, 1) if idempotent else 1
+
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            result = await operation()
+        except Exception as e:
+            if not is_backend_failure(e):
+                if isinstance(e, (httpx.HTTPStatusError, aiohttp.ClientResponseError)):
+                    breaker.record_success()  # The backend answered
+                else:
+                    breaker.release_probe()
+                raise
+            breaker.record_failure()
+            if attempt + 1 >= attempts or breaker.is_open or not budget.try_spend():
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Backend call to {backend} failed ({e}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            budget.deposit()
+            return result
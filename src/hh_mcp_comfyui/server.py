@@ -1,32 +1,67 @@
 import os
 import json
+import asyncio
 import logging
 from pathlib import Path
 import base64
-from typing import Optional, Dict, Any, Union
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Union, AsyncIterator, Iterable
 
 from pydantic import HttpUrl, Field
 
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.prompts import base as prompt_base
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 
 # Import the client logic
 try:
-    from . import comfyui_client
+    from . import comfyui_client, artifact_store, warmup, eta
 except ImportError:
     # Allow running directly for testing
-    from hh_mcp_comfyui import comfyui_client
+    from hh_mcp_comfyui import comfyui_client, artifact_store, warmup, eta
 
 # Enhanced logging configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Runs background tasks (journal reconciliation, workflow warm-up) for the lifetime of the server."""
+    reconcile_task = asyncio.create_task(_reconcile_journal())
+    warmup_task = warmup.start_warmup()
+    try:
+        yield
+    finally:
+        reconcile_task.cancel()
+        if warmup_task:
+            warmup_task.cancel()
+
+async def _reconcile_journal() -> None:
+    try:
+        await comfyui_client.reconcile_journal_async()
+    except ConnectionError as e:
+        logger.warning(f"Could not reconcile prompt journal, backend unreachable: {e}")
+
+class ComfyUIMCP(FastMCP):
+    """FastMCP server that labels artifact:// resources with the MIME type of their content."""
+
+    async def read_resource(self, uri) -> Iterable[ReadResourceContents]:
+        contents = await super().read_resource(uri)
+        if not str(uri).startswith("artifact://"):
+            return contents
+        return [
+            ReadResourceContents(content=c.content, mime_type=artifact_store.guess_mime_type(c.content))
+            if isinstance(c.content, bytes) else c
+            for c in contents
+        ]
+
 # Initialize FastMCP server with longer timeout (300 seconds)
-mcp = FastMCP(
+mcp = ComfyUIMCP(
     "ComfyUI_Generator",
     version="0.1.0",
     description="MCP Server to generate images using a local ComfyUI instance.",
-    timeout=300  # Increase timeout to 300 seconds (5 minutes)
+    timeout=300,  # Increase timeout to 300 seconds (5 minutes)
+    lifespan=server_lifespan
 )
 
 # --- Resource Loading ---
@@ -69,6 +104,14 @@ else:
             mcp.resource(resource_uri)(create_resource_func(file_path))
             logger.info(f"Registered resource: {resource_uri} -> {filename}")
 
+@mcp.resource("artifact://{digest}", mime_type="application/octet-stream")  # Per image type on read
+def get_artifact_resource(digest: str) -> bytes:
+    """Returns a generated image from the local artifact store by its sha256 digest."""
+    store = artifact_store.get_store()
+    if store is None or not artifact_store.is_digest(digest) or not store.contains(digest):
+        raise ValueError(f"Artifact not found: {digest}")
+    return store.read_bytes(digest)
+
 # --- Tool Definition ---
 
 @mcp.tool()
@@ -77,7 +120,15 @@ async def generate_image_from_text(
     workflow_name: str,
     width: int = 1024,
     height: int = 1024,
-    seed: Optional[int] = None  # Default seed value
+    seed: Optional[int] = None,  # Default seed value
+    steps: Optional[int] = None,
+    cfg: Optional[float] = None,
+    guidance: Optional[float] = None,
+    sampler_name: Optional[str] = None,
+    scheduler: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    draft: bool = False,
+    deadline_seconds: Optional[float] = None
 ) -> str:
     """
     Generates an image using ComfyUI based on the provided prompt and optional parameters.
@@ -88,24 +139,70 @@ async def generate_image_from_text(
                     If None, uses the default workflow ('t2image_bizyair_flux').
         width: The desired width of the image (default: 1024).
         height: The desired height of the image (default: 1024).
+        seed: Optional random seed for reproducibility.
+        steps: Optional number of sampling steps (workflow default if omitted).
+        cfg: Optional CFG scale.
+        guidance: Optional Flux guidance (FluxGuidance nodes), set independently of cfg.
+        sampler_name: Optional sampler, e.g. 'euler'.
+        scheduler: Optional scheduler, e.g. 'normal'.
+        batch_size: Optional number of images per prompt. Every image of the batch is returned.
+        draft: Render cheap low-step previews. With batch_size, each candidate is rendered with its own seed.
+               The result lists the seed of every candidate; call again with draft=False, the chosen
+               candidate's seed, the same width and height and batch_size=1 to refine only that one.
+        deadline_seconds: Optional deadline. The request is rejected immediately if it is not expected to finish in time.
     Returns:
-        A URL to view the generated image.
+        URLs to view the generated images, one per line.
     """
-    logger.info(f"generate_image_from_text called with prompt='{prompt}', width={width}, height={height}, workflow='{workflow_name}'")
+    logger.info(f"generate_image_from_text called with prompt='{prompt}', width={width}, height={height}, workflow='{workflow_name}', draft={draft}")
+    overrides = {
+        "steps": steps,
+        "cfg": cfg,
+        "guidance": guidance,
+        "sampler_name": sampler_name,
+        "scheduler": scheduler,
+        "batch_size": batch_size,
+    }
     try:
-        # 1. Load the specified or default workflow
-        workflow_data = comfyui_client.load_workflow(workflow_name)
-        logger.info(f"Loaded workflow: {workflow_name}")
-
-        # 2. Modify the workflow with user inputs
-        modified_workflow = comfyui_client.modify_workflow(workflow_data, prompt, width, height, seed)
-        logger.info(f"Modified workflow: {modified_workflow}")
-        
-        # 3. Generate the image using the modified workflow
-        image_url = await comfyui_client.generate_image_async(modified_workflow)
-
-        logger.info(f"Image generation successful, returning URL: {image_url}")
-        return image_url
+        # A fixed seed lets a picked draft be refined with the same noise and a retry reattach
+        request_params = {"tool": "generate_image_from_text", "prompt": prompt, "workflow": workflow_name,
+                          "width": width, "height": height, "overrides": overrides, "draft": draft}
+        with comfyui_client.request_seed(request_params, seed) as seed:
+            requested_size = (width, height)
+            candidate_seeds = [seed]
+            if draft:
+                width, height, overrides = comfyui_client.draft_parameters(width, height, overrides)
+                # One prompt per candidate, each with its own seed, so the chosen one can be refined alone
+                candidate_seeds = [seed + index for index in range(overrides["batch_size"] or 1)]
+                overrides["batch_size"] = 1
+
+            # 1. Load the specified workflow and modify it with user inputs, once per candidate
+            modified_workflows = []
+            for candidate_seed in candidate_seeds:
+                workflow_data = comfyui_client.load_workflow(workflow_name)
+                modified_workflows.append(
+                    comfyui_client.modify_workflow(workflow_data, prompt, width, height, candidate_seed, overrides)
+                )
+            logger.info(f"Modified workflow: {modified_workflows[0]}")
+
+            # 2. Generate the image(s) using the modified workflow(s)
+            results = await asyncio.gather(
+                *(comfyui_client.generate_images_async(workflow, deadline_seconds, workflow_name) for workflow in modified_workflows)
+            )
+
+            if not draft:
+                image_url = "\n".join(results[0])
+                logger.info(f"Image generation successful, returning URL(s): {image_url}")
+                return image_url
+
+            candidates = "\n".join(
+                f"{url} (seed={candidate_seed})" for candidate_seed, urls in zip(candidate_seeds, results) for url in urls
+            )
+            logger.info(f"Draft generation successful, returning candidates: {candidates}")
+            refine_hint = "To refine, call again with draft=false, batch_size=1 and the seed of the chosen candidate"
+            if (width, height) != requested_size:
+                # Noise depends on the latent size, a full-size refine will not match this draft
+                refine_hint += "; this draft was rendered at reduced size, so the refined image will differ"
+            return f"{candidates}\nDraft preview ({width}x{height}). {refine_hint}."
     except FileNotFoundError as e:
         logger.error(f"Workflow file error: {e}")
         return f"Error: Workflow '{workflow_name or comfyui_client.DEFAULT_WORKFLOW}' not found."
@@ -123,7 +220,14 @@ async def generate_image_from_image(
     workflow_name: str, # Default to the I2I workflow
     image_path_or_url: Union[HttpUrl, str, bytes] = Field(..., description="URL, local path, or image data as bytes."),
     denoise: float = 1.0,
-    seed: Optional[int] = None # Allow optional seed override
+    seed: Optional[int] = None, # Allow optional seed override
+    steps: Optional[int] = None,
+    cfg: Optional[float] = None,
+    guidance: Optional[float] = None,
+    sampler_name: Optional[str] = None,
+    scheduler: Optional[str] = None,
+    draft: bool = False,
+    deadline_seconds: Optional[float] = None
 ) -> str:
     """
     Generates an image using ComfyUI based on an input image (URL, local path, or bytes), prompt, and optional parameters.
@@ -134,11 +238,21 @@ async def generate_image_from_image(
         image_path_or_url: The URL or local file path or image data as bytes of the input image.
         denoise: Denoising strength (0.0 to 1.0). Controls how much the original image influences the result. to use (default: '1.0')
         seed: Optional random seed for reproducibility.
+        steps: Optional number of sampling steps (workflow default if omitted).
+        cfg: Optional CFG scale.
+        guidance: Optional Flux guidance (FluxGuidance nodes), set independently of cfg.
+        sampler_name: Optional sampler, e.g. 'euler'.
+        scheduler: Optional scheduler, e.g. 'normal'.
+        draft: Render a cheap low-step preview. The result includes the seed;
+               call again with draft=False and that seed to refine the chosen candidate.
+        deadline_seconds: Optional deadline. The request is rejected if it is not expected to finish in time.
     Returns:
         A URL to view the generated image or an error message.
     """
-    # Ensure seed is an integer if provided, generate random if None
-    final_seed = seed if seed is not None else comfyui_client.random.randint(1, 999999999)
+    overrides = {"steps": steps, "cfg": cfg, "guidance": guidance, "sampler_name": sampler_name, "scheduler": scheduler}
+    if draft:
+        # The input image decides the resolution, so a draft only reduces the steps
+        overrides = comfyui_client.draft_overrides(overrides)
     # Convert HttpUrl to string if necessary
     image_input = str(image_path_or_url) if isinstance(image_path_or_url, HttpUrl) else image_path_or_url
 
@@ -155,33 +269,39 @@ async def generate_image_from_image(
     else:
         image_input = str(image_path_or_url) if isinstance(image_path_or_url, HttpUrl) else image_path_or_url
 
-    logger.info(f"generate_image_from_image called with prompt='{prompt}', image='{image_input}', denoise={denoise}, workflow='{workflow_name}', seed={final_seed}")
+    logger.info(f"generate_image_from_image called with prompt='{prompt}', image='{image_input}', denoise={denoise}, workflow='{workflow_name}', seed={seed}")
+    request_params = {"tool": "generate_image_from_image", "prompt": prompt, "workflow": workflow_name,
+                      "image": str(image_path_or_url), "denoise": denoise, "overrides": overrides}
 
     try:
-        # 1. Load the specified I2I workflow
-        workflow_data = comfyui_client.load_workflow(workflow_name)
-        logger.info(f"Loaded I2I workflow: {workflow_name}")
-
-        # 2. Modify the workflow with user inputs (including uploading the image)
-        # Need a client_id for potential upload within modify_i2i_workflow
-        client_id = str(comfyui_client.uuid.uuid4())
-        modified_workflow = await comfyui_client.modify_i2i_workflow(
-            workflow_data,
-            prompt,
-            image_input,
-            denoise,
-            final_seed,
-            client_id=client_id # Pass client_id
-        )
-        logger.info("Modified I2I workflow successfully.")
-        # logger.debug(f"Modified I2I workflow details: {json.dumps(modified_workflow, indent=2)}") # Optional: log the full workflow
-
-        # 3. Generate the image using the modified workflow
-        # generate_image_async handles queuing, waiting, and result extraction
-        image_url = await comfyui_client.generate_image_async(modified_workflow) # generate_image_async already uses its own client_id internally for queueing
-
-        logger.info(f"Image generation from image successful, returning URL: {image_url}")
-        return image_url
+        with comfyui_client.request_seed(request_params, seed) as final_seed:
+            # 1. Load the specified I2I workflow
+            workflow_data = comfyui_client.load_workflow(workflow_name)
+            logger.info(f"Loaded I2I workflow: {workflow_name}")
+
+            # 2. Modify the workflow with user inputs (including uploading the image)
+            # Need a client_id for potential upload within modify_i2i_workflow
+            client_id = str(comfyui_client.uuid.uuid4())
+            modified_workflow = await comfyui_client.modify_i2i_workflow(
+                workflow_data,
+                prompt,
+                image_input,
+                denoise,
+                final_seed,
+                client_id=client_id, # Pass client_id
+                overrides=overrides
+            )
+            logger.info("Modified I2I workflow successfully.")
+            # logger.debug(f"Modified I2I workflow details: {json.dumps(modified_workflow, indent=2)}") # Optional: log the full workflow
+
+            # 3. Generate the image using the modified workflow
+            # generate_image_async handles queuing, waiting, and result extraction
+            image_url = await comfyui_client.generate_image_async(modified_workflow, deadline_seconds, workflow_name) # generate_image_async already uses its own client_id internally for queueing
+
+            logger.info(f"Image generation from image successful, returning URL: {image_url}")
+            if draft:
+                return f"{image_url}\nDraft preview (seed={final_seed}). To refine, call again with draft=false and seed={final_seed}."
+            return image_url
     except FileNotFoundError as e:
         logger.error(f"Workflow file error: {e}")
         return f"Error: Workflow '{workflow_name}' not found."
@@ -193,6 +313,174 @@ async def generate_image_from_image(
         return f"Error: An unexpected error occurred: {e}"
 
 
+@mcp.tool()
+async def generate_image_from_images(
+    prompt: str,
+    workflow_name: str,
+    images: Dict[str, str] = Field(..., description="Load image node ID or title -> URL, local path or data:image base64."),
+    denoise: float = 1.0,
+    seed: Optional[int] = None,
+    steps: Optional[int] = None,
+    cfg: Optional[float] = None,
+    guidance: Optional[float] = None,
+    sampler_name: Optional[str] = None,
+    scheduler: Optional[str] = None,
+    deadline_seconds: Optional[float] = None
+) -> str:
+    """
+    Generates an image with a workflow that has several input images, e.g. a reference image, a mask and a style image.
+    The images are uploaded in parallel.
+
+    Args:
+        prompt: The positive text prompt (It must be in English).
+        workflow_name: The name of the workflow file (without .json) to use.
+        images: Maps each load image node to fill, by node ID or node title, to a URL, local file path or data:image base64 string.
+        denoise: Denoising strength (0.0 to 1.0). to use (default: '1.0')
+        seed: Optional random seed for reproducibility.
+        steps: Optional number of sampling steps (workflow default if omitted).
+        cfg: Optional CFG scale.
+        guidance: Optional Flux guidance (FluxGuidance nodes), set independently of cfg.
+        sampler_name: Optional sampler, e.g. 'euler'.
+        scheduler: Optional scheduler, e.g. 'normal'.
+        deadline_seconds: Optional deadline. The request is rejected if it is not expected to finish in time.
+    Returns:
+        A URL to view the generated image or an error message.
+    """
+    overrides = {"steps": steps, "cfg": cfg, "guidance": guidance, "sampler_name": sampler_name, "scheduler": scheduler}
+
+    image_inputs: Dict[str, Union[str, bytes]] = {}
+    for node_ref, source in images.items():
+        if source.startswith("data:image"):
+            try:
+                image_inputs[node_ref] = base64.b64decode(source.split(",", 1)[1])
+            except Exception as e:
+                logger.error(f"Error decoding base64 image data for '{node_ref}': {e}")
+                return f"Error: Could not decode base64 image data for '{node_ref}': {e}"
+        else:
+            image_inputs[node_ref] = source
+
+    logger.info(f"generate_image_from_images called with prompt='{prompt}', images={list(images)}, denoise={denoise}, workflow='{workflow_name}', seed={seed}")
+    request_params = {"tool": "generate_image_from_images", "prompt": prompt, "workflow": workflow_name,
+                      "images": images, "denoise": denoise, "overrides": overrides}
+
+    try:
+        with comfyui_client.request_seed(request_params, seed) as final_seed:
+            workflow_data = comfyui_client.load_workflow(workflow_name)
+            modified_workflow = await comfyui_client.modify_multi_image_workflow(
+                workflow_data,
+                prompt,
+                image_inputs,
+                denoise,
+                final_seed,
+                overrides=overrides
+            )
+            image_url = await comfyui_client.generate_image_async(modified_workflow, deadline_seconds, workflow_name)
+            logger.info(f"Image generation from images successful, returning URL: {image_url}")
+            return image_url
+    except FileNotFoundError as e:
+        logger.error(f"Workflow or image file error: {e}")
+        return f"Error: {e}"
+    except (ConnectionError, ValueError, RuntimeError) as e:
+        logger.error(f"Image generation from images failed: {e}")
+        return f"Error generating image from images: {e}"
+    except Exception as e:
+        logger.exception("Unexpected error during image generation from images tool execution.")
+        return f"Error: An unexpected error occurred: {e}"
+
+
+@mcp.tool()
+async def generate_image_pipeline(
+    stages: list[Dict[str, Any]],
+    image_path_or_url: Optional[str] = None
+) -> str:
+    """
+    Runs several workflows in sequence on ComfyUI, feeding each stage's output image into the next
+    stage's load image node directly on the ComfyUI host (no download/re-upload between stages).
+    Example: [{"workflow_name": "t2image_bizyair_flux", "prompt": "a cat"}, {"workflow_name": "image_backgroud_remove"}]
+
+    Args:
+        stages: Ordered list of stages. Each stage is an object with 'workflow_name' (without .json) and
+                optional 'prompt' (English), 'width', 'height', 'seed', 'denoise', 'steps', 'cfg',
+                'guidance', 'sampler_name', 'scheduler' and 'batch_size'.
+        image_path_or_url: Input image (URL, local path or data:image base64) if the first stage loads an image.
+    Returns:
+        A URL to view the final image or an error message.
+    """
+    logger.info(f"generate_image_pipeline called with {len(stages)} stage(s): {[s.get('workflow_name') for s in stages]}")
+    image_input: Optional[Union[str, bytes]] = image_path_or_url
+    if image_path_or_url and image_path_or_url.startswith("data:image"):
+        try:
+            header, encoded = image_path_or_url.split(",", 1)
+            image_input = base64.b64decode(encoded)
+        except Exception as e:
+            logger.error(f"Error decoding base64 image data: {e}")
+            return f"Error: Could not decode base64 image data: {e}"
+
+    try:
+        image_url = await comfyui_client.run_pipeline_async(stages, image_input)
+        logger.info(f"Pipeline successful, returning URL: {image_url}")
+        return image_url
+    except FileNotFoundError as e:
+        logger.error(f"Workflow file error: {e}")
+        return f"Error: {e}"
+    except (ConnectionError, ValueError, RuntimeError) as e:
+        logger.error(f"Pipeline failed: {e}")
+        return f"Error running pipeline: {e}"
+    except Exception as e:
+        logger.exception("Unexpected error during pipeline tool execution.")
+        return f"Error: An unexpected error occurred: {e}"
+
+
+@mcp.tool()
+async def get_queue_eta() -> str:
+    """
+    Estimates when the prompts currently queued on ComfyUI will start and finish, based on the
+    execution times observed per workflow and resolution.
+
+    Returns:
+        JSON with 'queue' (prompt_id, status, expected_start_seconds, eta_seconds for each queued prompt)
+        and 'stats' (observed execution and queue-wait times), or an error message.
+    """
+    try:
+        estimates = await comfyui_client.estimate_queue_async()
+        return json.dumps({"queue": estimates, "stats": eta.get_estimator().summary()}, indent=2)
+    except (ConnectionError, ValueError) as e:
+        logger.error(f"Queue estimation failed: {e}")
+        return f"Error estimating queue: {e}"
+
+
+@mcp.tool()
+async def get_local_image(image_url: str) -> str:
+    """
+    Returns the local file path of a generated image, served from the local artifact store.
+
+    Args:
+        image_url: The image URL returned by one of the generate_image tools, or an artifact digest.
+    Returns:
+        The local file path and the artifact:// resource URI of the image, or an error message.
+    """
+    logger.info(f"get_local_image called with image_url='{image_url}'")
+    store = artifact_store.get_store()
+    if store is None:
+        return "Error: The local artifact store is disabled (COMFYUI_ARTIFACT_MAX_BYTES=0)."
+    digest = image_url.removeprefix("artifact://")
+    if artifact_store.is_digest(digest):
+        if not store.contains(digest):
+            return f"Error: Artifact not found: {digest}"
+        return f"{store.object_path(digest)}\nartifact://{digest}"
+    if not comfyui_client.is_backend_view_url(image_url):
+        return f"Error: Only image URLs of the ComfyUI server ({comfyui_client.COMFYUI_API_BASE}/view) or artifact digests are accepted."
+    try:
+        # Only reaches out to ComfyUI if the image is not held locally yet
+        digest = await comfyui_client.store_output_async(image_url, refresh=False)
+        if digest is None:
+            return f"Error: Could not fetch image '{image_url}' into the artifact store."
+        return f"{store.object_path(digest)}\nartifact://{digest}"
+    except Exception as e:
+        logger.exception("Unexpected error during get_local_image tool execution.")
+        return f"Error: An unexpected error occurred: {e}"
+
+
 # --- Prompt Definition ---
 
 @mcp.prompt(name="Generate Image with ComfyUI")
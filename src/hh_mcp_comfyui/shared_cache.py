@@ -0,0 +1,147 @@
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from contextlib import closing, contextmanager
+from typing import Optional, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: SQLite still serializes writers, evictions may just overlap
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOUCH_INTERVAL_SECONDS = 60.0  # Reads refresh last_access at most this often, to keep reads write-free
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+"""
+
+# --- Shared Cache Index ---
+
+class SharedCache:
+    """
+    Process-safe key/value index shared by every server process on the host.
+
+    Entries live in an SQLite database in WAL mode, so readers never block each other or
+    the writer. Each entry carries the size of the data it stands for (e.g. a blob on disk);
+    when the total exceeds max_bytes the least recently used entries are evicted under an
+    exclusive file lock, and the on_evict callback of their namespace removes the data.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.lock_path = self.path.with_suffix(".lock")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._on_evict: dict[str, Callable[[str, str], None]] = {}
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def on_evict(self, namespace: str, callback: Callable[[str, str], None]) -> None:
+        """Registers callback(key, value), called when an entry of namespace is evicted."""
+        self._on_evict[namespace] = callback
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value, last_access FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > TOUCH_INTERVAL_SECONDS:
+                conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?", (time.time(), namespace, key)
+                )
+        return row[0]
+
+    def touch(self, namespace: str, key: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ? AND last_access < ?",
+                (time.time(), namespace, key, time.time() - TOUCH_INTERVAL_SECONDS),
+            )
+
+    def put(self, namespace: str, key: str, value: str, size: Optional[int] = None) -> None:
+        """Inserts or replaces an entry; size defaults to the length of key and value."""
+        if size is None:
+            size = len(key) + len(value)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, size, time.time()),
+            )
+        self.evict()
+
+    def delete(self, namespace: str, key: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def count(self, namespace: str) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def total_size(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @contextmanager
+    def _eviction_lock(self) -> Iterator[bool]:
+        """Yields True if this process got the eviction lock; never waits for another evictor."""
+        if fcntl is None:
+            yield True
+            return
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self) -> int:
+        """Evicts least recently used entries until the total size fits; returns how many."""
+        if self.total_size() <= self.max_bytes:
+            return 0
+        with self._eviction_lock() as acquired:
+            if not acquired:
+                return 0  # Another process is already evicting
+            evicted = 0
+            with closing(self._connect()) as conn:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                rows = conn.execute(
+                    "SELECT namespace, key, value, size FROM entries ORDER BY last_access"
+                ).fetchall()
+                for namespace, key, value, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                    total -= size
+                    evicted += 1
+                    callback = self._on_evict.get(namespace)
+                    if callback:
+                        try:
+                            callback(key, value)
+                        except OSError as e:
+                            logger.warning(f"Eviction callback failed for {namespace}/{key}: {e}")
+            if evicted:
+                logger.info(f"Evicted {evicted} shared cache entries")
+            return evicted
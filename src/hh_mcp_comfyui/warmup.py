@@ -0,0 +1,127 @@
+import os
+import time
+import zlib
+import struct
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+try:
+    from . import comfyui_client
+except ImportError:
+    # Allow running this module directly for testing
+    from hh_mcp_comfyui import comfyui_client
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated workflow names to keep warm; empty disables warm-up
+WARMUP_WORKFLOWS = [name.strip() for name in os.getenv("COMFYUI_WARMUP_WORKFLOWS", "").split(",") if name.strip()]
+WARMUP_IDLE_SECONDS = float(os.getenv("COMFYUI_WARMUP_IDLE_SECONDS", "600"))
+WARMUP_SIZE = 64  # Smallest latent worth rendering
+WARMUP_RETRY_SECONDS = 5.0  # Delay while real traffic is running or queued
+
+# --- Warm-up Workflows ---
+
+def _tiny_png(size: int = WARMUP_SIZE) -> bytes:
+    """Encodes a grey size x size RGB PNG, used as input for image-to-image workflows."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    raw = b"".join(b"\x00" + b"\x80" * (size * 3) for _ in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+def _preview_instead_of_save(workflow: Dict[str, Any]) -> None:
+    """Turns save nodes into PreviewImage so warm-up renders don't land in the output directory."""
+    for node_data in workflow.values():
+        if node_data.get("class_type") in comfyui_client.SAVE_IMAGE_TYPES:
+            node_data["class_type"] = "PreviewImage"
+            node_data["inputs"] = {"images": node_data.get("inputs", {}).get("images")}
+
+def _fixed_size_instead_of_megapixel_scale(workflow: Dict[str, Any]) -> None:
+    """
+    Turns nodes that scale the input to about 1 megapixel (e.g. FluxKontextImageScale) into a
+    plain ImageScale to WARMUP_SIZE, so the reference image stays as small as the latent.
+    """
+    for node_data in workflow.values():
+        if node_data.get("class_type") in comfyui_client.MEGAPIXEL_SCALE_TYPES:
+            node_data["class_type"] = "ImageScale"
+            node_data["inputs"] = {
+                "image": node_data.get("inputs", {}).get("image"),
+                "upscale_method": "nearest-exact",
+                "width": WARMUP_SIZE,
+                "height": WARMUP_SIZE,
+                "crop": "disabled",
+            }
+
+async def build_warmup_workflow(workflow_name: str) -> Dict[str, Any]:
+    """
+    Derives a minimal-cost variant of a workflow through the usual node roles: a 64x64 latent,
+    1 sampling step and a batch of 1. Image-to-image workflows get a tiny uploaded input image,
+    and megapixel rescaling of that input is replaced by a fixed 64x64 scale. The seed stays
+    random so ComfyUI's output cache cannot skip the run.
+    """
+    workflow = comfyui_client.load_workflow(workflow_name)
+    overrides = {"steps": 1, "batch_size": 1}
+    if comfyui_client.find_load_image_node(workflow) is not None:
+        workflow = await comfyui_client.modify_i2i_workflow(
+            workflow, "warmup", _tiny_png(), denoise=1.0, overrides=overrides
+        )
+    else:
+        workflow = comfyui_client.modify_workflow(workflow, "warmup", WARMUP_SIZE, WARMUP_SIZE, None, overrides)
+    _fixed_size_instead_of_megapixel_scale(workflow)
+    _preview_instead_of_save(workflow)
+    return workflow
+
+# --- Keep-warm Scheduler ---
+
+async def backend_is_busy() -> bool:
+    """True while client prompts are running here or anything is queued on ComfyUI."""
+    if comfyui_client.active_prompts > 0:
+        return True
+    queue = await comfyui_client.get_queue_async()
+    return bool(queue.get("queue_running") or queue.get("queue_pending"))
+
+async def warm_up(workflow_names: list[str]) -> int:
+    """Runs the warm-up variant of each workflow, backing off while real traffic is present."""
+    warmed = 0
+    for workflow_name in workflow_names:
+        while await backend_is_busy():
+            logger.info(f"Warm-up of '{workflow_name}' deferred, backend busy")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+        try:
+            workflow = await build_warmup_workflow(workflow_name)
+            started = time.monotonic()
+            await comfyui_client.run_prompt_async(workflow, background=True)
+            logger.info(f"Warmed up '{workflow_name}' in {time.monotonic() - started:.1f}s")
+            warmed += 1
+        except (FileNotFoundError, ValueError) as e:
+            logger.error(f"Cannot warm up '{workflow_name}': {e}")
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"Warm-up of '{workflow_name}' failed: {e}")
+        except Exception as e:
+            logger.exception(f"Unexpected error warming up '{workflow_name}': {e}")
+    return warmed
+
+async def keep_warm_loop(workflow_names: list[str], idle_seconds: float) -> None:
+    """Warms up at start, then again whenever the backend has seen no traffic for idle_seconds."""
+    last_warmup_at = 0.0
+    check_interval = max(1.0, min(idle_seconds / 4, 60.0))
+    while True:
+        last_used_at = max(comfyui_client.last_activity_at, last_warmup_at)
+        if last_warmup_at == 0.0 or time.monotonic() - last_used_at >= idle_seconds:
+            try:
+                await warm_up(workflow_names)
+            except ConnectionError as e:
+                logger.warning(f"Warm-up skipped, backend unreachable: {e}")
+            except Exception as e:
+                # Keep the background task alive; the next idle period tries again
+                logger.exception(f"Warm-up failed unexpectedly: {e}")
+            last_warmup_at = time.monotonic()
+        await asyncio.sleep(check_interval)
+
+def start_warmup() -> Optional[asyncio.Task]:
+    """Starts the keep-warm loop if COMFYUI_WARMUP_WORKFLOWS is set. Must run inside the event loop."""
+    if not WARMUP_WORKFLOWS:
+        return None
+    logger.info(f"Keeping workflows warm: {WARMUP_WORKFLOWS} (idle threshold {WARMUP_IDLE_SECONDS}s)")
+    return asyncio.create_task(keep_warm_loop(WARMUP_WORKFLOWS, WARMUP_IDLE_SECONDS))
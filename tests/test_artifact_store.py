@@ -0,0 +1,57 @@
+import asyncio
+import sqlite3
+
+from hh_mcp_comfyui import artifact_store, server
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 16
+JPEG = b"\xff\xd8\xff\xe0" + b"\0" * 16
+WEBP = b"RIFF\0\0\0\0WEBPVP8 " + b"\0" * 16
+
+
+def test_guess_mime_type_from_magic_bytes():
+    assert artifact_store.guess_mime_type(PNG) == "image/png"
+    assert artifact_store.guess_mime_type(JPEG) == "image/jpeg"
+    assert artifact_store.guess_mime_type(WEBP) == "image/webp"
+    assert artifact_store.guess_mime_type(b"not an image") == "application/octet-stream"
+
+
+def test_artifact_resource_is_labelled_with_its_image_type(tmp_path, monkeypatch):
+    store = artifact_store.ArtifactStore(tmp_path, 1024 ** 2)
+    monkeypatch.setattr(artifact_store, "_store", store)
+    digest = "ab" * 32
+    path = store.object_path(digest)
+    path.parent.mkdir(parents=True)
+    path.write_bytes(JPEG)
+
+    contents = list(asyncio.run(server.mcp.read_resource(f"artifact://{digest}")))
+    assert [(c.content, c.mime_type) for c in contents] == [(JPEG, "image/jpeg")]
+
+
+def test_image_size_from_headers():
+    png = b"\x89PNG\r\n\x1a\n" + b"\0\0\0\rIHDR" + (640).to_bytes(4, "big") + (480).to_bytes(4, "big") + b"\x08\x02\0\0\0"
+    # SOI, an APP0 segment, then a baseline start of frame
+    jpeg = b"\xff\xd8" + b"\xff\xe0\x00\x04\x00\x00" + b"\xff\xc0\x00\x11\x08" + (600).to_bytes(2, "big") + (800).to_bytes(2, "big") + b"\x03"
+    assert artifact_store.image_size(png) == (640, 480)
+    assert artifact_store.image_size(jpeg) == (800, 600)
+    assert artifact_store.image_size(b"not an image") is None
+
+
+def test_corrupt_index_disables_the_store_instead_of_failing(tmp_path, monkeypatch):
+    (tmp_path / "index.sqlite3").write_bytes(b"this is not a database" * 100)
+    monkeypatch.setattr(artifact_store, "ARTIFACT_DIR", tmp_path)
+    monkeypatch.setattr(artifact_store, "_store", None)
+    assert artifact_store.get_store() is None
+
+
+def test_reading_an_artifact_survives_a_broken_index(tmp_path, monkeypatch):
+    store = artifact_store.ArtifactStore(tmp_path, 1024 ** 2)
+    digest = "cd" * 32
+    path = store.object_path(digest)
+    path.parent.mkdir(parents=True)
+    path.write_bytes(PNG)
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store.cache, "touch", locked)
+    assert store.read_bytes(digest) == PNG
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from hh_mcp_comfyui import comfyui_client
+from hh_mcp_comfyui.prompt_scheduler import AffinityScheduler
+
+
+def test_extract_output_images_returns_whole_batch_and_skips_temp_images():
+    history = {
+        "outputs": {
+            "8": {"images": [{"filename": "preview.png", "subfolder": "", "type": "temp"}]},
+            "9": {
+                "images": [
+                    {"filename": "ComfyUI_00001_.png", "subfolder": "2025-01-01", "type": "output"},
+                    {"filename": "ComfyUI_00002_.png", "subfolder": "2025-01-01", "type": "output"},
+                ]
+            },
+        }
+    }
+    assert comfyui_client.extract_output_images(history) == [
+        ("ComfyUI_00001_.png", "2025-01-01"),
+        ("ComfyUI_00002_.png", "2025-01-01"),
+    ]
+    assert comfyui_client.extract_output_info(history) == ("ComfyUI_00001_.png", "2025-01-01")
+
+
+def test_extract_output_info_without_outputs():
+    assert comfyui_client.extract_output_images({"outputs": {}}) == []
+    assert comfyui_client.extract_output_info({"outputs": {}}) is None
+
+
+def test_draft_keeps_resolution_by_default_so_refine_reproduces_it():
+    width, height, overrides = comfyui_client.draft_parameters(1024, 768, {"steps": 30, "cfg": 5})
+    assert (width, height) == (1024, 768)
+    assert overrides == {"steps": comfyui_client.DRAFT_STEPS, "cfg": 5}
+
+
+def test_failed_wait_does_not_leave_estimator_record(monkeypatch):
+    async def submit(workflow, client_id):
+        return "prompt-1"
+
+    def wait_fails(ws_url, client_id, prompt_id):
+        raise ConnectionError("backend went away")
+
+    monkeypatch.setattr(comfyui_client.journal, "get_journal", lambda: None)
+    monkeypatch.setattr(comfyui_client.prompt_scheduler, "get_scheduler", lambda *_: AffinityScheduler(submit, None, 0))
+    monkeypatch.setattr(comfyui_client, "wait_for_prompt_completion", wait_fails)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(comfyui_client.run_prompt_async({"1": {"class_type": "EmptyLatentImage", "inputs": {}}}))
+    assert "prompt-1" not in comfyui_client.eta.get_estimator()._prompts
+
+
+def test_failed_upload_cancels_and_awaits_the_other_uploads(monkeypatch):
+    workflow = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "a.png"}, "_meta": {"title": "Reference"}},
+        "2": {"class_type": "LoadImageMask", "inputs": {"image": "b.png"}, "_meta": {"title": "Mask"}},
+    }
+    slow_upload_cancelled = asyncio.Event()
+
+    async def upload(source, client_id):
+        if source == "missing.png":
+            raise FileNotFoundError(source)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            slow_upload_cancelled.set()
+            raise
+        return source
+
+    monkeypatch.setattr(comfyui_client, "upload_image_async", upload)
+
+    async def scenario():
+        with pytest.raises(FileNotFoundError):
+            await comfyui_client.modify_multi_image_workflow(
+                workflow, "prompt", {"Reference": "slow.png", "2": "missing.png"}
+            )
+        # Cancelled and awaited before the error propagated, nothing left running
+        assert slow_upload_cancelled.is_set()
+        assert [t for t in asyncio.all_tasks() if t is not asyncio.current_task()] == []
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=3))
+
+
+def test_cfg_and_flux_guidance_are_separate_overrides():
+    workflow = {
+        "1": {"class_type": "KSampler", "inputs": {"cfg": 1.0, "steps": 20}},
+        "2": {"class_type": "FluxGuidance", "inputs": {"guidance": 3.5}},
+    }
+    comfyui_client.apply_overrides(workflow, {"cfg": 7.0})
+    assert workflow["1"]["inputs"]["cfg"] == 7.0
+    assert workflow["2"]["inputs"]["guidance"] == 3.5
+
+    comfyui_client.apply_overrides(workflow, {"guidance": 2.5})
+    assert workflow["1"]["inputs"]["cfg"] == 7.0
+    assert workflow["2"]["inputs"]["guidance"] == 2.5
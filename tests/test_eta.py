@@ -0,0 +1,73 @@
+import asyncio
+
+from hh_mcp_comfyui import comfyui_client, eta, warmup
+from hh_mcp_comfyui.prompt_scheduler import AffinityScheduler
+
+
+def t2i_workflow(width=1024, height=1024):
+    return {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "flux.safetensors"}},
+        "2": {"class_type": "EmptyLatentImage", "inputs": {"width": width, "height": height, "batch_size": 1}},
+    }
+
+
+def i2i_workflow(image, *extra_types):
+    workflow = {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "flux.safetensors"}},
+        "2": {"class_type": "LoadImage", "inputs": {"image": image}},
+        "3": {"class_type": "VAEEncode", "inputs": {"pixels": ["2", 0]}},
+    }
+    for index, class_type in enumerate(extra_types):
+        workflow[str(10 + index)] = {"class_type": class_type, "inputs": {"image": ["2", 0]}}
+    return workflow
+
+
+def test_estimate_key_separates_workflows_sharing_a_model():
+    workflow = t2i_workflow()
+    assert eta.estimate_key(workflow, "t2i-flux") != eta.estimate_key(workflow, "i2i-flux")
+    assert eta.estimate_key(workflow, "t2i-flux").endswith(":1024x1024")
+
+
+def test_image_to_image_resolution_comes_from_the_uploaded_image():
+    comfyui_client.remember_input_image_size("abc_input.png", warmup._tiny_png(96))
+    assert eta.output_resolution(i2i_workflow("abc_input.png")) == (96, 96)
+    # Kontext rescales its input to about one megapixel
+    assert eta.output_resolution(i2i_workflow("abc_input.png", "FluxKontextImageScale")) == (1024, 1024)
+    assert eta.estimate_key(i2i_workflow("unknown.png"), "i2i").endswith(":any")
+
+
+def test_background_prompts_do_not_feed_the_estimates(monkeypatch):
+    estimator = eta.ExecutionEstimator()
+
+    async def submit(workflow, client_id):
+        return f"prompt-{client_id}"
+
+    def wait(ws_url, client_id, prompt_id):
+        estimator.mark_started(prompt_id)
+        estimator.mark_finished(prompt_id)
+
+    async def get_history(prompt_id):
+        return {"outputs": {}}
+
+    monkeypatch.setattr(eta, "_estimator", estimator)
+    monkeypatch.setattr(comfyui_client.journal, "get_journal", lambda: None)
+    monkeypatch.setattr(comfyui_client.prompt_scheduler, "get_scheduler", lambda *_: AffinityScheduler(submit, None, 0))
+    monkeypatch.setattr(comfyui_client, "wait_for_prompt_completion", wait)
+    monkeypatch.setattr(comfyui_client, "get_history_async", get_history)
+
+    asyncio.run(comfyui_client.run_prompt_async(t2i_workflow(64, 64), background=True))
+    assert estimator.execution == {}
+
+    asyncio.run(comfyui_client.run_prompt_async(t2i_workflow(), workflow_name="t2i-flux"))
+    assert list(estimator.execution) == [eta.estimate_key(t2i_workflow(), "t2i-flux")]
+
+
+def test_held_prompts_count_towards_admission():
+    estimator = eta.ExecutionEstimator()
+    empty_queue = {"queue_running": [], "queue_pending": []}
+    alone = estimator.estimate_new_prompt(empty_queue, t2i_workflow(), "t2i-flux")
+
+    estimator.hold("client-1", t2i_workflow(), "t2i-flux")
+    assert estimator.estimate_new_prompt(empty_queue, t2i_workflow(), "t2i-flux") > alone
+    estimator.release("client-1")
+    assert estimator.estimate_new_prompt(empty_queue, t2i_workflow(), "t2i-flux") == alone
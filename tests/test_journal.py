@@ -0,0 +1,41 @@
+import time
+from contextlib import closing
+
+from hh_mcp_comfyui import journal
+
+BACKEND = "http://127.0.0.1:8188"
+
+
+def test_prune_removes_old_finished_prompts_only(tmp_path):
+    db = journal.PromptJournal(tmp_path / "journal.sqlite3", retention_seconds=60)
+    db.append("old-done", "h1", BACKEND, journal.QUEUED)
+    db.append("old-done", "h1", BACKEND, journal.COMPLETED)
+    db.append("old-queued", "h2", BACKEND, journal.QUEUED)
+    db.append("new-done", "h3", BACKEND, journal.COMPLETED)
+    with closing(db._connect()) as conn, conn:
+        conn.execute("UPDATE journal SET at = ? WHERE prompt_id LIKE 'old-%'", (time.time() - 3600,))
+
+    assert db.prune() == 2
+    assert db.find_latest("h1", BACKEND) is None
+    assert db.pending(BACKEND) == [{"prompt_id": "old-queued", "request_hash": "h2"}]
+    assert db.find_latest("h3", BACKEND)["prompt_id"] == "new-done"
+
+
+def test_seed_of_running_request_is_not_reused(tmp_path):
+    db = journal.PromptJournal(tmp_path / "journal.sqlite3")
+    db.record_seed("key", BACKEND, 42)
+    # Owned by this (live) process: an identical concurrent call gets its own seed
+    assert db.take_orphaned_seed("key", BACKEND) is None
+
+
+def test_seed_of_interrupted_request_is_reused_once(tmp_path):
+    db = journal.PromptJournal(tmp_path / "journal.sqlite3")
+    db.record_seed("key", BACKEND, 42)
+    db.release_seed("key", BACKEND, 42, reusable=True)  # As if the owning process went away
+
+    assert db.take_orphaned_seed("key", BACKEND) == 42
+    assert db.take_orphaned_seed("key", BACKEND) is None
+
+
+def test_request_key_ignores_parameter_order():
+    assert journal.request_key({"a": 1, "b": {"c": 2}}) == journal.request_key({"b": {"c": 2}, "a": 1})
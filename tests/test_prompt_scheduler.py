@@ -0,0 +1,97 @@
+import asyncio
+
+from hh_mcp_comfyui.prompt_scheduler import AffinityScheduler
+
+SECOND = 0.05  # Simulated second, keeps the tests fast
+
+
+def make_workflow(ckpt_name: str) -> dict:
+    return {"1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": ckpt_name}}}
+
+
+class FakeComfyUI:
+    """First in, first out queue that runs each prompt for render_seconds."""
+
+    def __init__(self, render_seconds: float):
+        self.render_seconds = render_seconds
+        self.queue: list[list] = []  # [number, prompt_id, prompt], running entry first
+        self.executed: list[str] = []
+        self._runner = None
+
+    async def submit(self, workflow, client_id):
+        self.queue.append([len(self.executed) + len(self.queue), client_id, workflow])
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        return f"prompt-{client_id}"
+
+    async def get_queue(self):
+        return {"queue_running": self.queue[:1], "queue_pending": self.queue[1:]}
+
+    async def _run(self):
+        while self.queue:
+            await asyncio.sleep(self.render_seconds)
+            self.executed.append(self.queue.pop(0)[1])
+
+    async def drain(self):
+        while self.queue or len(self.executed) == 0:
+            await asyncio.sleep(SECOND / 10)
+
+
+def test_interleaved_models_arriving_a_second_apart_run_grouped():
+    async def scenario():
+        backend = FakeComfyUI(render_seconds=3 * SECOND)
+        scheduler = AffinityScheduler(backend.submit, backend.get_queue, 60 * SECOND, poll_seconds=SECOND / 10)
+        tasks = []
+        for client_id in ["sd15-1", "sdxl-1", "sd15-2", "sdxl-2", "sd15-3", "sdxl-3"]:
+            tasks.append(asyncio.create_task(scheduler.submit(make_workflow(client_id.split("-")[0]), client_id)))
+            await asyncio.sleep(SECOND)
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+        await asyncio.wait_for(backend.drain(), timeout=5)
+        return backend.executed
+
+    # Arrival order would swap models on every prompt; held prompts go out one model at a time
+    assert asyncio.run(scenario()) == ["sd15-1", "sd15-2", "sd15-3", "sdxl-1", "sdxl-2", "sdxl-3"]
+
+
+def test_idle_backend_gets_the_prompt_at_once():
+    async def scenario():
+        backend = FakeComfyUI(render_seconds=SECOND)
+        scheduler = AffinityScheduler(backend.submit, backend.get_queue, 600)
+        return await asyncio.wait_for(scheduler.submit(make_workflow("a"), "only"), timeout=1)
+
+    assert asyncio.run(scenario()) == "prompt-only"
+
+
+def test_prompt_held_past_budget_is_submitted_behind_busy_queue():
+    async def scenario():
+        submitted = []
+
+        async def submit(workflow, client_id):
+            submitted.append(client_id)
+            return f"prompt-{client_id}"
+
+        async def always_busy():
+            return {"queue_running": [[0, "external", make_workflow("other")]], "queue_pending": []}
+
+        scheduler = AffinityScheduler(submit, always_busy, 2 * SECOND, poll_seconds=SECOND / 10)
+        prompt_id = await asyncio.wait_for(scheduler.submit(make_workflow("a"), "held"), timeout=1)
+        return prompt_id, submitted, scheduler
+
+    prompt_id, submitted, scheduler = asyncio.run(scenario())
+    assert prompt_id == "prompt-held"
+    assert submitted == ["held"]
+    assert scheduler._pending == []
+
+
+def test_unreachable_queue_does_not_hold_prompts():
+    async def scenario():
+        async def submit(workflow, client_id):
+            return f"prompt-{client_id}"
+
+        async def queue_fails():
+            raise ConnectionError("backend went away")
+
+        scheduler = AffinityScheduler(submit, queue_fails, 600)
+        return await asyncio.wait_for(scheduler.submit(make_workflow("a"), "only"), timeout=1)
+
+    assert asyncio.run(scenario()) == "prompt-only"
@@ -0,0 +1,123 @@
+import asyncio
+
+import httpx
+import pytest
+
+from hh_mcp_comfyui import resilience
+from hh_mcp_comfyui.resilience import BackendUnavailableError, CircuitBreaker, RetryBudget
+
+BACKEND = "http://comfyui.test"
+
+
+@pytest.fixture(autouse=True)
+def fresh_backend_state(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_budgets", {})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+
+
+def failing_operation(exc: Exception):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise exc
+
+    return operation, calls
+
+
+def http_status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", f"{BACKEND}/prompt")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def test_breaker_opens_after_consecutive_failures_and_stops_calling_backend():
+    resilience._breakers[BACKEND] = CircuitBreaker(BACKEND, failure_threshold=3, recovery_seconds=60)
+    operation, calls = failing_operation(httpx.ConnectError("refused"))
+
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(resilience.call_backend(BACKEND, operation))
+    assert resilience.get_breaker(BACKEND).is_open
+
+    with pytest.raises(BackendUnavailableError):
+        asyncio.run(resilience.call_backend(BACKEND, operation))
+    assert len(calls) == 3
+
+
+def test_half_open_breaker_lets_a_single_probe_through():
+    breaker = CircuitBreaker(BACKEND, failure_threshold=1, recovery_seconds=0)
+    breaker.record_failure()
+    assert breaker.is_open
+
+    breaker.before_call()  # The probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(BackendUnavailableError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker(BACKEND, failure_threshold=1, recovery_seconds=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.is_open
+
+
+def test_client_error_counts_as_backend_success():
+    breaker = CircuitBreaker(BACKEND, failure_threshold=3, recovery_seconds=60)
+    resilience._breakers[BACKEND] = breaker
+    breaker.record_failure()
+    breaker.record_failure()
+
+    operation, calls = failing_operation(http_status_error(400))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(resilience.call_backend(BACKEND, operation, idempotent=True))
+
+    assert len(calls) == 1  # Not retried
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_server_error_counts_as_backend_failure():
+    breaker = CircuitBreaker(BACKEND, failure_threshold=1, recovery_seconds=60)
+    resilience._breakers[BACKEND] = breaker
+
+    operation, _ = failing_operation(http_status_error(503))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(resilience.call_backend(BACKEND, operation))
+    assert breaker.is_open
+
+
+def test_retries_stop_when_budget_is_exhausted(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_ATTEMPTS", 5)
+    resilience._breakers[BACKEND] = CircuitBreaker(BACKEND, failure_threshold=100, recovery_seconds=60)
+    resilience._budgets[BACKEND] = RetryBudget(ratio=0.5, max_tokens=1)
+
+    operation, calls = failing_operation(httpx.ConnectError("refused"))
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(resilience.call_backend(BACKEND, operation, idempotent=True))
+    assert len(calls) == 2  # The first call plus the one retry the budget allowed
+
+    # Two successful calls earn the next retry back
+    async def succeed():
+        return "ok"
+
+    for _ in range(2):
+        assert asyncio.run(resilience.call_backend(BACKEND, succeed)) == "ok"
+    calls.clear()
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(resilience.call_backend(BACKEND, operation, idempotent=True))
+    assert len(calls) == 2
+
+
+def test_non_idempotent_calls_are_not_retried(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_ATTEMPTS", 5)
+    operation, calls = failing_operation(httpx.ConnectError("refused"))
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(resilience.call_backend(BACKEND, operation))
+    assert len(calls) == 1
@@ -0,0 +1,32 @@
+import asyncio
+
+from hh_mcp_comfyui import warmup
+
+
+def test_keep_warm_loop_survives_unexpected_errors(monkeypatch):
+    calls = []
+
+    async def warm_up(workflow_names):
+        calls.append(workflow_names)
+        if len(calls) == 1:
+            raise ValueError("unexpected response")
+        return len(workflow_names)
+
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(seconds):
+        await real_sleep(0)
+
+    monkeypatch.setattr(warmup, "warm_up", warm_up)
+    monkeypatch.setattr(warmup.asyncio, "sleep", fast_sleep)
+
+    async def scenario():
+        # idle_seconds=0: every iteration warms up again
+        task = asyncio.create_task(warmup.keep_warm_loop(["t2image_sd1.5"], idle_seconds=0))
+        while len(calls) < 2 and not task.done():
+            await real_sleep(0)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=3))
+    assert len(calls) >= 2